@@ -0,0 +1,287 @@
+"""
+Exports driver positions and delivery tables to Parquet for offline analytics.
+
+Two jobs run in this service:
+
+    positions  every fix of the driver-pos topics, streamed to
+               <EXPORT_DIR>/positions/date=YYYY-MM-DD/region=<name>/*.parquet
+    snapshots  every EXPORT_SNAPSHOT_INTERVAL seconds, driver_status, orders and
+               driver_delivers read with a server-side cursor to
+               <EXPORT_DIR>/<table>/date=YYYY-MM-DD/region=<name>/*.parquet
+
+Positions are read with a consumer group of their own and offsets are only
+committed once the files holding them are closed, every EXPORT_ROLL_INTERVAL
+seconds, so a crash re-exports (at-least-once) instead of losing fixes. The
+region of a fix is the region of the topic or partition it was read from,
+else the region its position falls in, else "unassigned".
+
+Usage:
+    python exporter.py
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime, timezone
+
+import asyncpg
+import pyarrow as pa
+from dotenv import load_dotenv
+from kafka import KafkaConsumer
+from kafka.errors import KafkaError
+
+from parquet_sink import DRIVER_ID, POSITIONS_SCHEMA, PartitionedParquetWriter
+from shared.regions import RegionRouter
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='[%(asctime)s] :: %(levelname)s :: %(message)s'
+)
+load_dotenv()
+KAFKA_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092")
+KAFKA_TOPIC = os.getenv("KAFKA_TOPIC", "driver-pos")
+KAFKA_GROUP_ID = os.getenv("EXPORT_GROUP_ID", "analytics-export")
+DATABASE_URL = os.getenv("DATABASE_URL")
+EXPORT_DIR = os.getenv("EXPORT_DIR", "analytics")
+EXPORT_ROLL_INTERVAL = float(os.getenv("EXPORT_ROLL_INTERVAL", 300))
+EXPORT_SNAPSHOT_INTERVAL = float(os.getenv("EXPORT_SNAPSHOT_INTERVAL", 3600))
+EXPORT_ROW_GROUP_SIZE = int(os.getenv("EXPORT_ROW_GROUP_SIZE", 65536))
+EXPORT_MAX_BUFFERED_ROWS = int(os.getenv("EXPORT_MAX_BUFFERED_ROWS", 262144))
+logger = logging.getLogger('analytics_export')
+
+UNASSIGNED = "unassigned"
+# All rows of a table without a position land in this region partition
+ALL_REGIONS = "all"
+
+# Fix timestamps accepted, in epoch seconds: from 2000-01-01 to a day past the
+# local clock. Anything else is a bad phone clock or an epoch in milliseconds
+# and would land in a bogus date partition or overflow the microsecond column.
+MIN_FIX_TIMESTAMP = 946684800.0
+MAX_FIX_CLOCK_SKEW = 86400.0
+
+# Positions come out as lat/lon, geography values do not belong in Parquet.
+# Every snapshot lands in the partition of its day, told apart by snapshot_at.
+SNAPSHOT_QUERIES = {
+    "driver_status": (
+        """
+        SELECT driver_id::text, is_active, ST_Y(geoposition::geometry) AS lat,
+               ST_X(geoposition::geometry) AS lon, last_updated_at, now() AS snapshot_at
+        FROM driver_status
+        """,
+        pa.schema([
+            ("driver_id", DRIVER_ID),
+            ("is_active", pa.bool_()),
+            ("lat", pa.float64()),
+            ("lon", pa.float64()),
+            ("last_updated_at", pa.timestamp("us", tz="UTC")),
+            ("snapshot_at", pa.timestamp("us", tz="UTC")),
+        ]),
+    ),
+    "orders": (
+        """
+        SELECT id::text, customer_id::text, restaurant_id::text,
+               ST_Y(delivery_address::geometry) AS lat, ST_X(delivery_address::geometry) AS lon,
+               order_details::text, created_at, now() AS snapshot_at
+        FROM orders
+        """,
+        pa.schema([
+            ("id", pa.string()),
+            ("customer_id", pa.string()),
+            ("restaurant_id", pa.string()),
+            ("lat", pa.float64()),
+            ("lon", pa.float64()),
+            ("order_details", pa.string()),
+            ("created_at", pa.timestamp("us", tz="UTC")),
+            ("snapshot_at", pa.timestamp("us", tz="UTC")),
+        ]),
+    ),
+    "driver_delivers": (
+        """
+        SELECT id::text, order_id::text, driver_id::text, delivery_status,
+               remaining_time_seconds, assigned_at, completed_at, now() AS snapshot_at
+        FROM driver_delivers
+        """,
+        pa.schema([
+            ("id", pa.string()),
+            ("order_id", pa.string()),
+            ("driver_id", DRIVER_ID),
+            ("delivery_status", pa.dictionary(pa.int8(), pa.string())),
+            ("remaining_time_seconds", pa.int32()),
+            ("assigned_at", pa.timestamp("us", tz="UTC")),
+            ("completed_at", pa.timestamp("us", tz="UTC")),
+            ("snapshot_at", pa.timestamp("us", tz="UTC")),
+        ]),
+    ),
+}
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def utc_date(epoch_seconds: float) -> str:
+    return datetime.fromtimestamp(epoch_seconds, timezone.utc).strftime("%Y-%m-%d")
+
+
+def region_name(router: RegionRouter, topic: str, partition: int, lat: float, lon: float) -> str:
+    region = router.region_of(topic, partition) or router.region_for_position(lat, lon)
+    return region.name if region else UNASSIGNED
+
+
+class PositionExporter:
+    """Turns driver-pos records into rows of the positions dataset."""
+
+    def __init__(self, writer: PartitionedParquetWriter, router: RegionRouter):
+        self.writer = writer
+        self.router = router
+        self.exported = 0
+        self.skipped = 0
+        self._day = None
+        self._date = None
+
+    def export(self, value: bytes, topic: str, partition: int, offset: int, kafka_timestamp: int):
+        try:
+            fix = json.loads(value)
+            driver_id, timestamp, lat, lon = fix['driver_id'], fix['timestamp'], fix['lat'], fix['lon']
+            # Same checks as the bridge's validate_fix, which the legacy bridge
+            # skips: a mistyped value would make pyarrow raise in the writer
+            if not isinstance(driver_id, str) or not driver_id:
+                raise ValueError(f"driver_id {driver_id!r} is not a string")
+            if not all(map(_is_number, (timestamp, lat, lon))):
+                raise ValueError("timestamp, lat and lon must be numbers")
+            if not (-90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0):
+                raise ValueError(f"position {lat}, {lon} out of range")
+            timestamp, lat, lon = float(timestamp), float(lat), float(lon)
+            if not MIN_FIX_TIMESTAMP <= timestamp <= time.time() + MAX_FIX_CLOCK_SKEW:
+                raise ValueError(f"timestamp {timestamp} out of range")
+            day = timestamp // 86400
+            if day != self._day:
+                # Formatting a date per fix costs as much as decoding it
+                self._date, self._day = utc_date(timestamp), day
+        except (ValueError, KeyError, TypeError, OverflowError, OSError):
+            self.skipped += 1
+            return
+        self.writer.append(
+            self._date,
+            region_name(self.router, topic, partition, lat, lon),
+            (driver_id, int(timestamp * 1_000_000), lat, lon, kafka_timestamp, partition, offset),
+        )
+        self.exported += 1
+
+
+async def snapshot_table(conn, table: str, root: str, router: RegionRouter, batch_size: int = 10000) -> int:
+    """Copy one table to its dataset with a server-side cursor. Returns the rows exported."""
+    query, schema = SNAPSHOT_QUERIES[table]
+    date = utc_date(time.time())
+    has_position = "lat" in schema.names
+    writer = PartitionedParquetWriter(
+        os.path.join(root, table), schema,
+        row_group_size=EXPORT_ROW_GROUP_SIZE, max_buffered_rows=EXPORT_MAX_BUFFERED_ROWS,
+    )
+    rows = 0
+    try:
+        async with conn.transaction(isolation="repeatable_read", readonly=True):
+            cursor = await conn.cursor(query)
+            while True:
+                records = await cursor.fetch(batch_size)
+                if not records:
+                    break
+                for record in records:
+                    region = ALL_REGIONS
+                    if has_position:
+                        place = None
+                        if record['lat'] is not None:
+                            place = router.region_for_position(record['lat'], record['lon'])
+                        region = place.name if place else UNASSIGNED
+                    writer.append(date, region, tuple(record.values()))
+                rows += len(records)
+    finally:
+        writer.close()
+    return rows
+
+
+class SnapshotThread(threading.Thread):
+    """Exports the delivery tables every ``interval`` seconds."""
+
+    def __init__(self, root: str, router: RegionRouter, interval: float):
+        super().__init__(name="table-snapshots", daemon=True)
+        self.root = root
+        self.router = router
+        self.interval = interval
+        self._stopping = threading.Event()
+
+    def run(self):
+        while not self._stopping.is_set():
+            try:
+                asyncio.run(self._snapshot())
+            except (asyncpg.PostgresError, OSError) as e:
+                logger.error(f"🔥 Table snapshot failed: {e}")
+            self._stopping.wait(self.interval)
+
+    async def _snapshot(self):
+        conn = await asyncpg.connect(DATABASE_URL)
+        try:
+            for table in SNAPSHOT_QUERIES:
+                started = time.monotonic()
+                rows = await snapshot_table(conn, table, self.root, self.router)
+                logger.info(f"🗄️  Exported {rows} rows of {table} in {time.monotonic() - started:.1f}s")
+        finally:
+            await conn.close()
+
+    def stop(self):
+        self._stopping.set()
+
+
+def main():
+    logger.info("📦 Analytics exporter starting...")
+    router = RegionRouter.from_env(KAFKA_TOPIC)
+    try:
+        consumer = KafkaConsumer(
+            bootstrap_servers=KAFKA_SERVERS,
+            group_id=KAFKA_GROUP_ID,
+            enable_auto_commit=False,
+            auto_offset_reset="earliest",
+        )
+        consumer.subscribe(pattern=f"^{re.escape(KAFKA_TOPIC)}(\\..+)?$")
+    except KafkaError as e:
+        logger.error(f"🚨 Could not connect to Kafka: {e}")
+        return
+
+    writer = PartitionedParquetWriter(
+        os.path.join(EXPORT_DIR, "positions"), POSITIONS_SCHEMA,
+        row_group_size=EXPORT_ROW_GROUP_SIZE, max_buffered_rows=EXPORT_MAX_BUFFERED_ROWS,
+    )
+    exporter = PositionExporter(writer, router)
+    snapshots = SnapshotThread(EXPORT_DIR, router, EXPORT_SNAPSHOT_INTERVAL)
+    snapshots.start()
+
+    last_roll = time.monotonic()
+    try:
+        while True:
+            for tp, messages in consumer.poll(timeout_ms=1000, max_records=5000).items():
+                for message in messages:
+                    exporter.export(message.value, tp.topic, tp.partition, message.offset, message.timestamp)
+
+            if time.monotonic() - last_roll >= EXPORT_ROLL_INTERVAL:
+                # Offsets are committed only once the rows they cover are in closed files
+                writer.close_files()
+                consumer.commit()
+                logger.info(f"📈 {exporter.exported} fixes exported to {len(writer.files_written)} files, "
+                            f"{exporter.skipped} skipped")
+                last_roll = time.monotonic()
+    except KeyboardInterrupt:
+        logger.info("🛑 Exporter stopped by user.")
+    finally:
+        snapshots.stop()
+        writer.close_files()
+        consumer.commit()
+        consumer.close()
+        logger.info("✅ Exporter closed.")
+
+
+if __name__ == "__main__":
+    main()
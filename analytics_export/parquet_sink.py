@@ -0,0 +1,151 @@
+"""
+Partitioned Parquet datasets written with bounded memory.
+
+Rows are appended per partition (``date=YYYY-MM-DD/region=<name>``) into
+column buffers. A partition's buffer becomes a row group of its open file once
+it holds ``row_group_size`` rows; when all buffers together reach
+``max_buffered_rows``, the largest one is written early, so memory stays
+bounded by that figure whatever the number of partitions. Files are written
+under a ``.inprogress`` name and renamed when closed, so readers only ever see
+complete Parquet files.
+"""
+
+import os
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Driver IDs repeat every few seconds, so they are stored as dictionary codes
+DRIVER_ID = pa.dictionary(pa.int32(), pa.string())
+
+POSITIONS_SCHEMA = pa.schema([
+    ("driver_id", DRIVER_ID),
+    ("timestamp", pa.timestamp("us", tz="UTC")),
+    ("lat", pa.float64()),
+    ("lon", pa.float64()),
+    ("kafka_timestamp", pa.timestamp("ms", tz="UTC")),
+    ("kafka_partition", pa.int32()),
+    ("kafka_offset", pa.int64()),
+])
+
+IN_PROGRESS_SUFFIX = ".inprogress"
+
+
+def partition_path(date: str, region: str) -> str:
+    return f"date={date}/region={region}"
+
+
+class _Partition:
+    __slots__ = ("columns", "rows", "writer", "path", "file_rows")
+
+    def __init__(self, names):
+        self.columns = {name: [] for name in names}
+        self.rows = 0
+        self.writer = None
+        self.path = None
+        self.file_rows = 0
+
+
+class PartitionedParquetWriter:
+    """
+    Appends rows to a dataset of Parquet files partitioned by date and region.
+
+    Args:
+        root (str): Dataset directory.
+        schema (pyarrow.Schema): Columns of every row.
+        row_group_size (int): Rows per row group.
+        max_buffered_rows (int): Rows kept in memory over all partitions.
+        max_file_rows (int): Rows after which a partition starts a new file.
+        compression (str): Parquet codec.
+        use_dictionary (bool): Dictionary-encode column pages, on top of dictionary-typed columns.
+    """
+
+    def __init__(self, root: str, schema: pa.Schema, row_group_size: int = 65536,
+                 max_buffered_rows: int = 262144, max_file_rows: int = 4_000_000,
+                 compression: str = "zstd", use_dictionary: bool = True):
+        self.root = root
+        self.schema = schema
+        self.row_group_size = row_group_size
+        self.max_buffered_rows = max_buffered_rows
+        self.max_file_rows = max_file_rows
+        self.compression = compression
+        self.use_dictionary = use_dictionary
+        self.rows_written = 0
+        self.files_written: List[str] = []
+        self._names = schema.names
+        self._partitions: Dict[Tuple[str, str], _Partition] = {}
+        self._buffered = 0
+
+    def append(self, date: str, region: str, row: tuple):
+        """Buffer one row, a tuple in schema order."""
+        partition = self._partitions.get((date, region))
+        if partition is None:
+            partition = self._partitions[(date, region)] = _Partition(self._names)
+        for name, value in zip(self._names, row):
+            partition.columns[name].append(value)
+        partition.rows += 1
+        self._buffered += 1
+
+        if partition.rows >= self.row_group_size:
+            self._write_row_group((date, region), partition)
+        elif self._buffered >= self.max_buffered_rows:
+            key = max(self._partitions, key=lambda k: self._partitions[k].rows)
+            self._write_row_group(key, self._partitions[key])
+
+    def _write_row_group(self, key, partition: _Partition):
+        if not partition.rows:
+            return
+        table = pa.table(partition.columns, schema=self.schema)
+        if partition.writer is None:
+            directory = os.path.join(self.root, partition_path(*key))
+            os.makedirs(directory, exist_ok=True)
+            partition.path = os.path.join(directory, f"part-{uuid.uuid4().hex}.parquet")
+            partition.writer = pq.ParquetWriter(
+                partition.path + IN_PROGRESS_SUFFIX,
+                self.schema,
+                compression=self.compression,
+                use_dictionary=self.use_dictionary,
+            )
+        partition.writer.write_table(table, row_group_size=self.row_group_size)
+        partition.file_rows += partition.rows
+        self.rows_written += partition.rows
+        self._buffered -= partition.rows
+        partition.columns = {name: [] for name in self._names}
+        partition.rows = 0
+
+        if partition.file_rows >= self.max_file_rows:
+            self._close_file(partition)
+
+    def _close_file(self, partition: _Partition):
+        if partition.writer is None:
+            return
+        partition.writer.close()
+        os.replace(partition.path + IN_PROGRESS_SUFFIX, partition.path)
+        self.files_written.append(partition.path)
+        partition.writer = None
+        partition.path = None
+        partition.file_rows = 0
+
+    @property
+    def buffered_rows(self) -> int:
+        return self._buffered
+
+    def close_files(self, date: Optional[str] = None):
+        """
+        Write every buffer and close the open files, making them visible.
+
+        Args:
+            date (str, optional): Only close partitions of dates before this one.
+        """
+        for key in list(self._partitions):
+            if date is not None and key[0] >= date:
+                continue
+            partition = self._partitions[key]
+            self._write_row_group(key, partition)
+            self._close_file(partition)
+            del self._partitions[key]
+
+    def close(self):
+        self.close_files()
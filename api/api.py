@@ -1,26 +1,32 @@
+import asyncio
 import os
+from contextlib import asynccontextmanager
+
 import asyncpg
 from fastapi import FastAPI, HTTPException, Depends
 from pydantic import BaseModel
 from typing import Optional
 from uuid import UUID
 from dotenv import load_dotenv
-from pydantic_settings import BaseSettings
 
 load_dotenv()
 
-class Settings(BaseSettings):
-    database_url: str = os.getenv("DATABASE_URL")
-
-settings = Settings()
+from shared.database import Database, health_router
+from shared.admission import ActiveDrivers
+from shared.diagnostics import start_diagnostics
+from shared.queries import TRACK_DELIVERY_SQL
+from density import DensityFeeder, density_router
+from density_grid import DensityGrid
 
-db_pool: Optional[asyncpg.Pool] = None
-
-async def get_db_connection() -> asyncpg.Connection:
-    if not db_pool:
-        raise HTTPException(status_code=503, detail="Database connection is not available.")
-    async with db_pool.acquire() as connection:
-        yield connection
+# Port uvicorn serves on, see the command in docker-compose.yml
+PORT = int(os.getenv("PORT", 8000))
+# The probe looks up an order that cannot exist
+database = Database(statements={"track_delivery": TRACK_DELIVERY_SQL},
+                    probe=("track_delivery", (UUID(int=0),)))
+density_grid = DensityGrid.from_env()
+# Which drivers the density tiles count as active, from driver_delivers
+active_drivers = ActiveDrivers.from_env()
+density_feeder = DensityFeeder(density_grid, active_drivers)
 
 class DriverLocation(BaseModel):
     latitude: float
@@ -37,51 +43,44 @@ class DeliveryTrackingResponse(BaseModel):
     class Config:
         form_attributes = True
 
-app = FastAPI(
-    title="Food Delivery Tracking API",
-    description="API for customers to track their food delivery in real-time.",
-    version="1.0.0"
-)
-
-@app.on_event("startup")
-async def startup_event():
-    global db_pool
+@asynccontextmanager
+async def lifespan(app: FastAPI):
     try:
-        db_pool = await asyncpg.create_pool(settings.database_url)
-        print("Database connection pool created successfully.")
+        await database.connect()
+        print("Database connection pool created and warmed up.")
     except Exception as e:
         print(f"🔥 Failed to create database connection pool: {e}")
-        db_pool = None
+    if active_drivers:
+        active_drivers.start()
+    density_feeder.start()
+    # Off unless DIAGNOSTICS_PORT is set, and never on the public port
+    diagnostics = start_diagnostics("api", public_ports=(PORT,))
+    if diagnostics:
+        diagnostics.watch_loop(asyncio.get_running_loop())
+    yield
+    if diagnostics:
+        diagnostics.stop()
+    density_feeder.stop()
+    if active_drivers:
+        active_drivers.stop()
+    await database.close()
+    print("Database connection pool closed.")
 
-@app.on_event("shutdown")
-async def shutdown_event():
-    if db_pool:
-        await db_pool.close()
-        print("Database connection pool closed.")
+app = FastAPI(
+    title="Food Delivery Tracking API",
+    description="API for customers to track their food delivery in real-time.",
+    version="1.0.0",
+    lifespan=lifespan
+)
+app.include_router(health_router(database))
+app.include_router(density_router(density_grid))
 
 @app.get("/track/{order_id}",
          response_model=DeliveryTrackingResponse,
          tags=["Tracking"],
          summary="Track a delivery by Order ID")
-async def track_delivery(order_id: UUID, db: asyncpg.Connection = Depends(get_db_connection)):
-    query = """
-            SELECT dd.order_id,
-                   dd.delivery_status,
-                   ROUND((ST_Distance(ds.geoposition::geography, o.delivery_address::geography) / 100.0) * 60.0) AS remaining_time_seconds,
-                   d.full_name                    AS driver_name,
-                   r.name                         AS restaurant_name,
-
-                   ST_Y(ds.geoposition::geometry) AS driver_latitude,
-                   ST_X(ds.geoposition::geometry) AS driver_longitude
-            FROM driver_delivers dd 
-                     JOIN orders o ON dd.order_id = o.id 
-                     JOIN restaurants r ON o.restaurant_id = r.id 
-                -- LEFT JOINs are used for driver info, as an order might be assigned but not yet in progress 
-                     LEFT JOIN drivers d ON dd.driver_id = d.id 
-                     LEFT JOIN driver_status ds ON dd.driver_id = ds.driver_id AND ds.is_active = TRUE
-            WHERE dd.order_id = $1; 
-            """
-    record = await db.fetchrow(query, order_id)
+async def track_delivery(order_id: UUID, db: asyncpg.Connection = Depends(database.connection)):
+    record = await db.statement("track_delivery").fetchrow(order_id)
 
     if not record:
         raise HTTPException(status_code=404, detail="Order not found.")
@@ -0,0 +1,167 @@
+"""
+Driver supply density endpoint, fed from the driver-pos stream.
+
+A background thread reads every region topic of driver-pos (without a
+consumer group, each API instance needs all fixes) and feeds the shared
+``DensityGrid``; ``GET /density`` returns the non-empty tiles of a bounding
+box at the requested zoom level.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException, Query
+from kafka import KafkaConsumer, TopicPartition
+from kafka.errors import KafkaError
+from pydantic import BaseModel
+
+from density_grid import DensityGrid
+from shared.admission import PRIORITY_ACTIVE, ActiveDrivers
+
+KAFKA_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092")
+KAFKA_TOPIC = os.getenv("KAFKA_TOPIC", "driver-pos")
+# Largest number of tiles a single request may cover, empty ones included
+DENSITY_MAX_TILES = int(os.getenv("DENSITY_MAX_TILES", 20000))
+logger = logging.getLogger('density')
+
+
+class DensityTile(BaseModel):
+    south: float
+    west: float
+    active: int
+    idle: int
+
+
+class DensityResponse(BaseModel):
+    level: int
+    cell_deg: float
+    updated_at: float
+    active: int
+    idle: int
+    tiles: List[DensityTile]
+
+
+class DensityFeeder:
+    """
+    Keeps a DensityGrid up to date from Kafka in a daemon thread.
+
+    A driver counts as active while ``active_drivers`` (refreshed from
+    driver_delivers) has an in_progress delivery for them; without it every
+    driver is idle.
+    """
+
+    def __init__(self, grid: DensityGrid, active_drivers: Optional[ActiveDrivers] = None,
+                 expire_interval: float = 10.0, refresh_interval: float = 60.0):
+        self.grid = grid
+        self.active_drivers = active_drivers
+        self.expire_interval = expire_interval
+        self.refresh_interval = refresh_interval
+        self.fixes = 0
+        self.errors = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="density-feeder", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(5)
+
+    def _assign(self, consumer):
+        """Assign every partition of the base topic and its region topics, new ones included."""
+        pattern = re.compile(f"^{re.escape(KAFKA_TOPIC)}(\\..+)?$")
+        partitions = []
+        for topic in consumer.topics():
+            if pattern.match(topic):
+                partitions.extend(TopicPartition(topic, p) for p in consumer.partitions_for_topic(topic) or ())
+        if set(partitions) != consumer.assignment():
+            consumer.assign(partitions)
+            # Only current positions matter, skip the backlog
+            consumer.seek_to_end(*partitions)
+        return partitions
+
+    def _run(self):
+        try:
+            consumer = KafkaConsumer(bootstrap_servers=KAFKA_SERVERS, group_id=None)
+            partitions = self._assign(consumer)
+        except KafkaError as e:
+            logger.error(f"🔥 Density feeder could not connect to Kafka: {e}")
+            return
+        logger.info(f"🗺️  Density feeder reading {len(partitions)} partitions of '{KAFKA_TOPIC}*'")
+
+        last_expire = last_refresh = time.monotonic()
+        try:
+            while not self._stop.is_set():
+                for messages in consumer.poll(timeout_ms=500).values():
+                    for message in messages:
+                        self._feed(message.value)
+
+                now = time.monotonic()
+                if now - last_expire >= self.expire_interval:
+                    self.grid.expire()
+                    last_expire = now
+                if now - last_refresh >= self.refresh_interval:
+                    self._assign(consumer)
+                    last_refresh = now
+        finally:
+            consumer.close()
+
+    def _feed(self, value: bytes):
+        try:
+            fix = json.loads(value)
+            if 'event' in fix:
+                # A driver_events state event, without a position
+                return
+            self.grid.update(
+                fix['driver_id'], float(fix['lat']), float(fix['lon']),
+                self._is_active(fix['driver_id']), float(fix['timestamp']),
+            )
+            self.fixes += 1
+        except (ValueError, KeyError, TypeError):
+            self.errors += 1
+
+    def _is_active(self, driver_id) -> bool:
+        return self.active_drivers is not None and self.active_drivers.priority(driver_id) == PRIORITY_ACTIVE
+
+
+def density_router(grid: DensityGrid) -> APIRouter:
+    """Router serving tiles of ``grid`` at /density."""
+    router = APIRouter(tags=["Density"])
+
+    @router.get("/density", response_model=DensityResponse, summary="Driver density tiles in a bounding box")
+    async def density(
+        south: float = Query(..., ge=-90, le=90),
+        west: float = Query(..., ge=-180, le=180),
+        north: float = Query(..., ge=-90, le=90),
+        east: float = Query(..., ge=-180, le=180),
+        level: int = Query(0, ge=0, description="0 is the finest level, each level doubles the tile side"),
+    ):
+        if south >= north or west >= east:
+            raise HTTPException(status_code=400, detail="Empty bounding box.")
+        if level >= grid.levels:
+            raise HTTPException(status_code=400, detail=f"level must be below {grid.levels}.")
+        if grid.tile_count(south, west, north, east, level) > DENSITY_MAX_TILES:
+            raise HTTPException(status_code=400, detail="Bounding box too large for this level, use a coarser one.")
+
+        snapshot = grid.snapshot(south, west, north, east, level)
+        tiles = [
+            DensityTile(south=s, west=w, active=a, idle=i)
+            for s, w, a, i in zip(snapshot.south.tolist(), snapshot.west.tolist(),
+                                  snapshot.active.tolist(), snapshot.idle.tolist())
+        ]
+        return DensityResponse(
+            level=level,
+            cell_deg=snapshot.cell_deg,
+            updated_at=grid.updated_at,
+            active=int(snapshot.active.sum()),
+            idle=int(snapshot.idle.sum()),
+            tiles=tiles,
+        )
+
+    return router
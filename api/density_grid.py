@@ -0,0 +1,184 @@
+"""
+Incrementally maintained driver density grid.
+
+The service area is cut into fixed lat/lon tiles of ``cell_deg`` degrees and
+two NumPy count arrays (active and idle drivers) hold one counter per tile.
+Every driver has a slot in flat per-driver arrays that remember the tile and
+class it is currently counted in, so a fix costs a dict lookup, a decrement
+and an increment whatever the number of drivers. Coarser zoom levels, where a
+tile covers 2**level finest tiles per side, are summed from the finest one
+with a vectorized reshape when a snapshot is taken.
+
+Drivers not heard from in ``ttl`` seconds are dropped by ``expire``, also
+vectorized over the slot arrays.
+"""
+
+import os
+import threading
+import time
+from typing import Dict, NamedTuple, Optional
+
+import numpy as np
+
+ACTIVE = 0
+IDLE = 1
+# Tile of a driver that is not counted anywhere (unknown, expired or out of the area)
+NO_CELL = -1
+
+
+class Snapshot(NamedTuple):
+    level: int
+    cell_deg: float
+    # South-west corner of each non-empty tile, with its counts
+    south: np.ndarray
+    west: np.ndarray
+    active: np.ndarray
+    idle: np.ndarray
+
+
+class DensityGrid:
+    """
+    Active and idle driver counts per tile.
+
+    Args:
+        south, west, north, east (float): Service area; fixes outside are not counted.
+        cell_deg (float): Side of the finest tiles, in degrees.
+        levels (int): Zoom levels available to snapshots, the finest being 0.
+        ttl (float): Seconds after which a silent driver stops being counted.
+        capacity (int): Driver slots allocated up front, grown by doubling.
+    """
+
+    def __init__(self, south: float, west: float, north: float, east: float,
+                 cell_deg: float = 0.005, levels: int = 4, ttl: float = 120.0,
+                 capacity: int = 1 << 17):
+        self.south = south
+        self.west = west
+        self.cell_deg = cell_deg
+        self.levels = levels
+        self.ttl = ttl
+
+        # Padded so every coarser tile is made of whole finest tiles
+        block = 1 << (levels - 1)
+        self.rows = -(-int(np.ceil((north - south) / cell_deg)) // block) * block
+        self.cols = -(-int(np.ceil((east - west) / cell_deg)) // block) * block
+        self.north = south + self.rows * cell_deg
+        self.east = west + self.cols * cell_deg
+        self.counts = np.zeros((2, self.rows * self.cols), dtype=np.int32)
+
+        self._slots: Dict[str, int] = {}
+        self.cell = np.full(capacity, NO_CELL, dtype=np.int32)
+        self.klass = np.zeros(capacity, dtype=np.int8)
+        self.last_seen = np.zeros(capacity, dtype=np.float64)
+        self.out_of_area = 0
+        self.updated_at = 0.0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "DensityGrid":
+        """Grid configured from DENSITY_BBOX ("south,west,north,east"), DENSITY_CELL_DEG,
+        DENSITY_LEVELS and DENSITY_TTL. The default area is greater Madrid."""
+        south, west, north, east = (
+            float(v) for v in os.getenv("DENSITY_BBOX", "40.20,-4.00,40.70,-3.40").split(","))
+        return cls(
+            south, west, north, east,
+            cell_deg=float(os.getenv("DENSITY_CELL_DEG", 0.005)),
+            levels=int(os.getenv("DENSITY_LEVELS", 4)),
+            ttl=float(os.getenv("DENSITY_TTL", 120)),
+        )
+
+    def __len__(self):
+        return len(self._slots)
+
+    def _grow(self):
+        extra = len(self.cell)
+        self.cell = np.concatenate([self.cell, np.full(extra, NO_CELL, dtype=np.int32)])
+        self.klass = np.concatenate([self.klass, np.zeros(extra, dtype=np.int8)])
+        self.last_seen = np.concatenate([self.last_seen, np.zeros(extra, dtype=np.float64)])
+
+    def cell_of(self, lat: float, lon: float) -> int:
+        row = int((lat - self.south) / self.cell_deg)
+        col = int((lon - self.west) / self.cell_deg)
+        if lat < self.south or lon < self.west or row >= self.rows or col >= self.cols:
+            return NO_CELL
+        return row * self.cols + col
+
+    def update(self, driver_id: str, lat: float, lon: float, active: bool,
+               timestamp: Optional[float] = None):
+        """Move a driver to the tile of its latest fix, in the class of that fix."""
+        cell = self.cell_of(lat, lon)
+        klass = ACTIVE if active else IDLE
+        now = time.time() if timestamp is None else timestamp
+        with self._lock:
+            slot = self._slots.get(driver_id)
+            if slot is None:
+                slot = len(self._slots)
+                if slot == len(self.cell):
+                    self._grow()
+                self._slots[driver_id] = slot
+            else:
+                old = self.cell[slot]
+                if old != NO_CELL:
+                    self.counts[self.klass[slot], old] -= 1
+            if cell != NO_CELL:
+                self.counts[klass, cell] += 1
+            else:
+                self.out_of_area += 1
+            self.cell[slot] = cell
+            self.klass[slot] = klass
+            self.last_seen[slot] = now
+            self.updated_at = now
+
+    def expire(self, now: Optional[float] = None) -> int:
+        """Stop counting drivers silent for more than ``ttl`` seconds. Returns how many."""
+        now = time.time() if now is None else now
+        with self._lock:
+            used = len(self._slots)
+            stale = np.flatnonzero((self.cell[:used] != NO_CELL) & (self.last_seen[:used] < now - self.ttl))
+            if stale.size:
+                np.subtract.at(self.counts, (self.klass[stale], self.cell[stale]), 1)
+                self.cell[stale] = NO_CELL
+        return int(stale.size)
+
+    def totals(self) -> Dict[str, int]:
+        return {"active": int(self.counts[ACTIVE].sum()), "idle": int(self.counts[IDLE].sum())}
+
+    def tile_count(self, south: float, west: float, north: float, east: float, level: int = 0) -> int:
+        """Tiles a snapshot of this box would cover, empty ones included."""
+        r0, r1, c0, c1 = self._window(south, west, north, east, 1 << level)
+        return ((r1 - r0) >> level) * ((c1 - c0) >> level)
+
+    def _window(self, south, west, north, east, block):
+        """Finest-tile rows and columns covering the box, aligned to ``block``."""
+        r0 = max(0, int((south - self.south) / self.cell_deg)) // block * block
+        c0 = max(0, int((west - self.west) / self.cell_deg)) // block * block
+        r1 = min(self.rows, -(-int(np.ceil((north - self.south) / self.cell_deg)) // block) * block)
+        c1 = min(self.cols, -(-int(np.ceil((east - self.west) / self.cell_deg)) // block) * block)
+        return r0, max(r0, r1), c0, max(c0, c1)
+
+    def snapshot(self, south: float, west: float, north: float, east: float, level: int = 0) -> Snapshot:
+        """
+        Non-empty tiles of a zoom level intersecting a bounding box.
+
+        Raises:
+            ValueError: If ``level`` is not one of the grid's levels.
+        """
+        if not 0 <= level < self.levels:
+            raise ValueError(f"level must be between 0 and {self.levels - 1}")
+        block = 1 << level
+        r0, r1, c0, c1 = self._window(south, west, north, east, block)
+        with self._lock:
+            window = self.counts.reshape(2, self.rows, self.cols)[:, r0:r1, c0:c1].copy()
+
+        if level:
+            rows, cols = (r1 - r0) // block, (c1 - c0) // block
+            window = window.reshape(2, rows, block, cols, block).sum(axis=(2, 4))
+        tile_rows, tile_cols = np.nonzero(window.sum(axis=0))
+        tile_deg = self.cell_deg * block
+        return Snapshot(
+            level=level,
+            cell_deg=tile_deg,
+            south=np.round(self.south + r0 * self.cell_deg + tile_rows * tile_deg, 6),
+            west=np.round(self.west + c0 * self.cell_deg + tile_cols * tile_deg, 6),
+            active=window[ACTIVE, tile_rows, tile_cols],
+            idle=window[IDLE, tile_rows, tile_cols],
+        )
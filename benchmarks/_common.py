@@ -0,0 +1,77 @@
+"""
+Helpers shared by the benchmark scripts in this folder.
+
+The scripts are run directly (``python benchmarks/<name>.py``), so this module
+is imported as a sibling rather than as part of a package.
+"""
+
+import asyncio
+import math
+import time
+
+
+def percentile(sorted_samples, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_samples:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_samples)))
+    return sorted_samples[rank - 1]
+
+
+def summarize(latencies, elapsed):
+    """
+    Summarize a list of latencies (seconds) into the figures we report.
+
+    Returns:
+        dict: count, throughput (ops/s) and mean/p50/p95/p99/max in milliseconds.
+    """
+    samples = sorted(latencies)
+    count = len(samples)
+    return {
+        "count": count,
+        "throughput": round(count / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(sum(samples) / count * 1000, 3) if count else 0.0,
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+        "max_ms": round(samples[-1] * 1000, 3) if count else 0.0,
+    }
+
+
+async def run_concurrently(call, concurrency, duration, warmup=0.0):
+    """
+    Run ``await call(worker_id)`` from ``concurrency`` workers for ``duration`` seconds.
+
+    Calls made during the first ``warmup`` seconds are executed but not recorded.
+
+    Returns:
+        tuple: (latencies in seconds, measured elapsed seconds)
+    """
+    latencies = []
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    measure_from = start + warmup
+    stop_at = measure_from + duration
+
+    async def worker(worker_id):
+        while True:
+            now = loop.time()
+            if now >= stop_at:
+                return
+            t0 = time.perf_counter()
+            await call(worker_id)
+            if now >= measure_from:
+                latencies.append(time.perf_counter() - t0)
+
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    return latencies, max(loop.time() - measure_from, 1e-9)
+
+
+def print_table(title, rows, columns):
+    """Print a list of dicts as a fixed-width table."""
+    print(f"\n{title}")
+    widths = {c: max([len(c)] + [len(str(r.get(c, ""))) for r in rows]) for c in columns}
+    print("  ".join(c.ljust(widths[c]) for c in columns))
+    print("  ".join("-" * widths[c] for c in columns))
+    for row in rows:
+        print("  ".join(str(row.get(c, "")).ljust(widths[c]) for c in columns))
@@ -0,0 +1,173 @@
+"""
+Load test of priority-aware admission control under overload.
+
+Simulates a stage of the ingest path (the bridge or a driver_events consumer)
+as a FIFO queue drained at ``capacity`` fixes/s, fed by drivers that each send
+a fix every ``--period`` seconds. A share of the drivers has a delivery in
+progress. The offered load is set to several multiples of capacity and every
+scenario runs twice: without admission control, and with the shared
+``AdmissionController`` in front of the queue (queue depth observed on arrival,
+queueing delay observed when a fix is processed).
+
+Time is simulated, so results are deterministic for a seed and do not depend
+on the machine. Tracking freshness is sampled every second after a warm-up:
+for each driver, the age of the newest fix the stage has processed.
+
+Usage:
+    python benchmarks/admission_load.py --drivers 20000 --load 0.8 1.5 3
+"""
+
+import argparse
+import random
+import sys
+from collections import deque
+from pathlib import Path
+
+from _common import percentile, print_table
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from shared.admission import PRIORITY_ACTIVE, PRIORITY_IDLE, AdmissionController
+
+
+class SimClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def freshness(last_processed, drivers, now):
+    """Sorted ages of the newest processed fix of ``drivers``."""
+    return sorted(now - last_processed[d] for d in drivers)
+
+
+def simulate(load, with_admission, args):
+    rng = random.Random(args.seed)
+    clock = SimClock()
+    drivers = [f"driver-{i}" for i in range(args.drivers)]
+    active = set(rng.sample(range(args.drivers), int(args.drivers * args.active_share)))
+    idle = [i for i in range(args.drivers) if i not in active]
+    active = sorted(active)
+
+    ticks_per_period = round(args.period / args.tick)
+    # Drivers grouped by the tick, within each period, at which they publish
+    groups = [[] for _ in range(ticks_per_period)]
+    for i in range(args.drivers):
+        groups[rng.randrange(ticks_per_period)].append(i)
+
+    offered_rate = args.drivers / args.period
+    capacity = offered_rate / load
+    admission = AdmissionController(
+        max_queue_depth=round(capacity * args.queue_target),
+        latency_target=args.queue_target,
+        idle_rate=capacity * args.idle_budget,
+        idle_sample_interval=args.idle_sample_interval,
+        clock=clock,
+    ) if with_admission else None
+
+    queue = deque()
+    last_processed = [0.0] * args.drivers
+    budget = 0.0
+    processed = offered = queue_max = 0
+    active_p50, active_p95, idle_p50, idle_p95 = [], [], [], []
+    is_active = bytearray(args.drivers)
+    for i in active:
+        is_active[i] = 1
+
+    total_ticks = round(args.duration / args.tick)
+    sample_every = round(1.0 / args.tick)
+    warmup_ticks = round(args.warmup / args.tick)
+    for tick in range(total_ticks):
+        now = clock.now = tick * args.tick
+
+        for i in groups[tick % ticks_per_period]:
+            offered += 1
+            if admission is not None:
+                admission.observe_queue_depth(len(queue))
+                if not admission.admit(PRIORITY_ACTIVE if is_active[i] else PRIORITY_IDLE, drivers[i]):
+                    continue
+            queue.append((i, now))
+        queue_max = max(queue_max, len(queue))
+
+        budget += capacity * args.tick
+        while budget >= 1 and queue:
+            i, sent_at = queue.popleft()
+            budget -= 1
+            processed += 1
+            last_processed[i] = sent_at
+            if admission is not None:
+                admission.observe_latency(now - sent_at)
+        if not queue:
+            budget = min(budget, 1.0)
+
+        if tick >= warmup_ticks and tick % sample_every == 0:
+            ages = freshness(last_processed, active, now)
+            active_p50.append(percentile(ages, 50))
+            active_p95.append(percentile(ages, 95))
+            ages = freshness(last_processed, idle, now)
+            idle_p50.append(percentile(ages, 50))
+            idle_p95.append(percentile(ages, 95))
+
+    shed = admission.shed if admission else {PRIORITY_ACTIVE: 0, PRIORITY_IDLE: 0}
+    active_offered = len(active) * offered / args.drivers
+    return {
+        "admission": "on" if with_admission else "off",
+        "load": f"x{load:g}",
+        "offered_per_s": round(offered / args.duration),
+        "capacity_per_s": round(capacity),
+        "processed_per_s": round(processed / args.duration),
+        "queue_max": queue_max,
+        "shed_active": f"{shed[PRIORITY_ACTIVE] / max(active_offered, 1):.1%}",
+        "shed_idle": f"{shed[PRIORITY_IDLE] / max(offered - active_offered, 1):.1%}",
+        # Averages over the samples of the per-sample percentiles
+        "active_p50_s": round(sum(active_p50) / len(active_p50), 2),
+        "active_p95_s": round(sum(active_p95) / len(active_p95), 2),
+        "active_p95_max_s": round(max(active_p95), 2),
+        "idle_p50_s": round(sum(idle_p50) / len(idle_p50), 2),
+        "idle_p95_s": round(sum(idle_p95) / len(idle_p95), 2),
+    }
+
+
+def main(args):
+    rows = []
+    for load in args.load:
+        for with_admission in (False, True):
+            print(f"⏱️  Load x{load:g}, admission {'on' if with_admission else 'off'}...")
+            rows.append(simulate(load, with_admission, args))
+
+    print_table(
+        f"Tracking freshness under load ({args.drivers} drivers, {args.active_share:.0%} active, "
+        f"a fix every {args.period:g}s, {args.duration:g}s simulated)",
+        rows,
+        ["admission", "load", "offered_per_s", "capacity_per_s", "processed_per_s", "queue_max",
+         "shed_active", "shed_idle", "active_p50_s", "active_p95_s", "active_p95_max_s",
+         "idle_p50_s", "idle_p95_s"],
+    )
+    print(f"\nA driver's newest fix is at best 0 to {args.period:g}s old; "
+          "freshness ages are in seconds of simulated time.")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--drivers", type=int, default=20_000)
+    parser.add_argument("--active-share", type=float, default=0.1, help="share of drivers with a delivery going")
+    parser.add_argument("--period", type=float, default=4.0, help="seconds between fixes of a driver")
+    parser.add_argument("--load", type=float, nargs="+", default=[0.8, 1.5, 3.0],
+                        help="offered load as a multiple of the stage capacity")
+    parser.add_argument("--duration", type=float, default=180.0, help="simulated seconds")
+    parser.add_argument("--warmup", type=float, default=30.0, help="simulated seconds before sampling")
+    parser.add_argument("--tick", type=float, default=0.01, help="simulation step in seconds")
+    parser.add_argument("--queue-target", type=float, default=1.0,
+                        help="queueing delay, in seconds of capacity, considered saturated")
+    parser.add_argument("--idle-budget", type=float, default=0.3,
+                        help="share of capacity left to idle fixes while saturated")
+    parser.add_argument("--idle-sample-interval", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -0,0 +1,146 @@
+"""
+Per-message CPU cost of the MQTT-Kafka bridge: parse-and-reserialize vs passthrough.
+
+Runs ``MQTTClient._forward_parsed`` (decode, json.loads, INFO logging, then the
+producer's json.dumps + encode) and ``MQTTClient._forward_passthrough``
+(validate and forward the original bytes) over the same generated fixes.
+Kafka network I/O is left out: the producer stand-in only performs the
+serialization work the real ``KafkaProducerWrapper`` does before sending.
+Logging goes to /dev/null with the bridge's usual INFO level and format.
+
+Usage:
+    python benchmarks/bridge_passthrough.py --messages 200000
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import time
+import uuid
+from pathlib import Path
+
+from _common import print_table
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+sys.path.insert(0, str(ROOT_DIR / "python_mqtt"))
+
+import payload as payload_module
+from mqtt_client import MQTTClient
+
+
+class SerializingProducer:
+    """Stand-in for KafkaProducerWrapper doing only its CPU work."""
+
+    def __init__(self):
+        self.sent = 0
+        self.dead_letters = 0
+
+    def send_message(self, topic, message, partition=None):
+        json.dumps(message).encode('utf-8')
+        self.sent += 1
+        return True
+
+    def send_raw(self, topic, value, key=None, headers=None, partition=None):
+        self.sent += 1
+        return True
+
+    def send_dead_letter(self, payload, reason, source_topic, topic=None):
+        self.dead_letters += 1
+        return True
+
+
+class Message:
+    __slots__ = ("topic", "payload")
+
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+def generate_messages(count, drivers, malformed_ratio):
+    driver_ids = [str(uuid.uuid4()) for _ in range(drivers)]
+    messages = []
+    for _ in range(count):
+        if random.random() < malformed_ratio:
+            body = b'{"driver_id": "broken"'
+        else:
+            body = json.dumps({
+                "driver_id": random.choice(driver_ids),
+                "timestamp": time.time(),
+                "lat": random.uniform(40.35, 40.50),
+                "lon": random.uniform(-3.80, -3.60),
+            }).encode('utf-8')
+        messages.append(Message("sensor/data", body))
+    return messages
+
+
+def configure_logging():
+    handler = logging.StreamHandler(open(os.devnull, "w"))
+    handler.setFormatter(logging.Formatter('[%(asctime)s] :: %(levelname)s :: %(message)s'))
+    logger = logging.getLogger('mqtt_kafka_bridge')
+    logger.handlers = [handler]
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+def measure(label, forward, messages):
+    producer = SerializingProducer()
+    started_cpu = time.process_time()
+    started_wall = time.perf_counter()
+    for msg in messages:
+        forward(producer, msg)
+    cpu = time.process_time() - started_cpu
+    wall = time.perf_counter() - started_wall
+    return {
+        "path": label,
+        "messages": len(messages),
+        "cpu_us_per_msg": round(cpu / len(messages) * 1e6, 2),
+        "msgs_per_cpu_s": round(len(messages) / cpu) if cpu else "-",
+        "wall_s": round(wall, 3),
+        "forwarded": producer.sent,
+        "dead_letters": producer.dead_letters,
+    }
+
+
+def main(args):
+    configure_logging()
+    messages = generate_messages(args.messages, args.drivers, args.malformed_ratio)
+    client = MQTTClient(kafka_producer=None)
+
+    rows = [measure("parse + reserialize", client._forward_parsed, messages)]
+
+    if payload_module.orjson is not None:
+        rows.append(measure("passthrough (orjson)", client._forward_passthrough, messages))
+    # Same path with the standard library decoder, as used when orjson is missing
+    fast_loads = payload_module._loads
+    payload_module._loads = json.loads
+    try:
+        rows.append(measure("passthrough (json)", client._forward_passthrough, messages))
+    finally:
+        payload_module._loads = fast_loads
+
+    baseline = rows[0]["cpu_us_per_msg"]
+    for row in rows:
+        row["speedup"] = f"x{baseline / row['cpu_us_per_msg']:.2f}" if row["cpu_us_per_msg"] else "-"
+
+    print_table(
+        "MQTT-Kafka bridge per-message CPU cost",
+        rows,
+        ["path", "messages", "cpu_us_per_msg", "msgs_per_cpu_s", "speedup", "wall_s", "forwarded", "dead_letters"],
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--messages", type=int, default=200_000)
+    parser.add_argument("--drivers", type=int, default=100_000)
+    parser.add_argument("--malformed-ratio", type=float, default=0.001)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(parse_args())
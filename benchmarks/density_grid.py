@@ -0,0 +1,116 @@
+"""
+Update rate and snapshot latency of the API's driver density grid.
+
+Places ``--drivers`` drivers in the default service area, then streams
+``--fixes`` position updates (drivers moving a few hundred metres, changing
+class now and then) through ``DensityGrid.update``. Snapshot latency is
+measured for the whole area and for a city-centre box at every zoom level,
+and compared with rebuilding the counts from scratch with ``np.bincount``,
+the in-memory equivalent of a GROUP BY over driver_status.
+
+Usage:
+    python benchmarks/density_grid.py --drivers 100000 --fixes 500000
+"""
+
+import argparse
+import random
+import sys
+import time
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+from _common import percentile, print_table
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR / "api"))
+
+from density_grid import DensityGrid
+
+CENTRE = (40.40, -3.73, 40.45, -3.67)
+
+
+def timed(call, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    return round(percentile(samples, 50) * 1000, 3), round(percentile(samples, 95) * 1000, 3)
+
+
+def main(args):
+    grid = DensityGrid.from_env()
+    rng = random.Random(args.seed)
+    drivers = [str(uuid.uuid4()) for _ in range(args.drivers)]
+    lats = [rng.uniform(grid.south, grid.north) for _ in drivers]
+    lons = [rng.uniform(grid.west, grid.east) for _ in drivers]
+    active = [rng.random() < args.active_share for _ in drivers]
+
+    started = time.perf_counter()
+    for i, driver_id in enumerate(drivers):
+        grid.update(driver_id, lats[i], lons[i], active[i], 0.0)
+    load = time.perf_counter() - started
+
+    moves = []
+    for _ in range(args.fixes):
+        i = rng.randrange(args.drivers)
+        lats[i] += rng.uniform(-0.003, 0.003)
+        lons[i] += rng.uniform(-0.003, 0.003)
+        if rng.random() < 0.01:
+            active[i] = not active[i]
+        moves.append((drivers[i], lats[i], lons[i], active[i]))
+
+    update = grid.update
+    started = time.perf_counter()
+    for driver_id, lat, lon, is_active in moves:
+        update(driver_id, lat, lon, is_active, 1.0)
+    elapsed = time.perf_counter() - started
+
+    print_table(f"Density grid updates ({args.drivers} drivers, {grid.rows}x{grid.cols} finest tiles)", [
+        {"phase": "initial placement", "fixes": args.drivers, "seconds": round(load, 3),
+         "fixes_per_s": round(args.drivers / load), "us_per_fix": round(load / args.drivers * 1e6, 2)},
+        {"phase": "moving drivers", "fixes": args.fixes, "seconds": round(elapsed, 3),
+         "fixes_per_s": round(args.fixes / elapsed), "us_per_fix": round(elapsed / args.fixes * 1e6, 2)},
+    ], ["phase", "fixes", "seconds", "fixes_per_s", "us_per_fix"])
+
+    rows = []
+    area = (grid.south, grid.west, grid.north, grid.east)
+    for name, box in (("whole area", area), ("city centre", CENTRE)):
+        for level in range(grid.levels):
+            snapshot = grid.snapshot(*box, level=level)
+            p50, p95 = timed(lambda: grid.snapshot(*box, level=level), args.repeat)
+            rows.append({"box": name, "level": level, "tile_deg": round(snapshot.cell_deg, 4),
+                         "tiles": len(snapshot.active), "p50_ms": p50, "p95_ms": p95})
+
+    used = len(grid)
+
+    def rebuild():
+        cells = grid.cell[:used]
+        counted = cells >= 0
+        return np.bincount(cells[counted] * 2 + grid.klass[:used][counted], minlength=grid.rows * grid.cols * 2)
+
+    p50, p95 = timed(rebuild, args.repeat)
+    rows.append({"box": "full rebuild (bincount)", "level": 0, "tile_deg": grid.cell_deg,
+                 "tiles": grid.rows * grid.cols, "p50_ms": p50, "p95_ms": p95})
+    p50, p95 = timed(lambda: grid.expire(2.0), args.repeat)
+    rows.append({"box": "expire sweep", "level": "", "tile_deg": "", "tiles": "", "p50_ms": p50, "p95_ms": p95})
+
+    print_table("Snapshot latency", rows, ["box", "level", "tile_deg", "tiles", "p50_ms", "p95_ms"])
+    print(f"\nCounted: {grid.totals()}, out of area fixes: {grid.out_of_area}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--drivers", type=int, default=100_000)
+    parser.add_argument("--fixes", type=int, default=500_000)
+    parser.add_argument("--active-share", type=float, default=0.3)
+    parser.add_argument("--repeat", type=int, default=50, help="runs per snapshot measurement")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(parse_args())
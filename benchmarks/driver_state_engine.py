@@ -0,0 +1,166 @@
+"""
+Throughput and memory of the driver_events state engine.
+
+Loads ``--drivers`` drivers into ``DriverStateEngine``, then drives random
+drivers through full delivery cycles (assign, pick up, depart, complete)
+interleaved with position fixes, with and without the write-ahead log. Memory
+per driver is measured with tracemalloc and compared with the obvious
+dict-of-dicts store. Snapshot and recovery (snapshot + WAL replay) times are
+reported too.
+
+Usage:
+    python benchmarks/driver_state_engine.py --drivers 1000000 --events 2000000
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from pathlib import Path
+
+from _common import print_table
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR / "driver_events"))
+
+from state_engine import DriverEvent, DriverStateEngine
+
+CYCLE = [DriverEvent.ASSIGN, DriverEvent.PICK_UP, DriverEvent.DEPART, DriverEvent.COMPLETE]
+
+
+def measure_memory(driver_ids):
+    """Bytes per driver for the engine and for a dict of per-driver dicts."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    engine = DriverStateEngine(capacity=len(driver_ids))
+    for i, driver_id in enumerate(driver_ids):
+        engine.apply(driver_id, DriverEvent.POSITION, float(i), 40.4 + i * 1e-7, -3.7 - i * 1e-7)
+    engine_bytes = tracemalloc.get_traced_memory()[0] - before
+    del engine
+
+    before = tracemalloc.get_traced_memory()[0]
+    naive = {}
+    for i, driver_id in enumerate(driver_ids):
+        naive[driver_id] = {"state": "idle", "lat": 40.4 + i * 1e-7, "lon": -3.7 - i * 1e-7,
+                            "updated_at": float(i)}
+    naive_bytes = tracemalloc.get_traced_memory()[0] - before
+    del naive
+    tracemalloc.stop()
+    # The ID strings are shared input to both, not part of either store
+    return engine_bytes / len(driver_ids), naive_bytes / len(driver_ids)
+
+
+def build_schedule(driver_ids, events, fixes_per_transition):
+    """Random (driver index, event) pairs that are always valid."""
+    phase = [0] * len(driver_ids)
+    schedule = []
+    while len(schedule) < events:
+        index = random.randrange(len(driver_ids))
+        schedule.append((index, CYCLE[phase[index]]))
+        phase[index] = (phase[index] + 1) % len(CYCLE)
+        for _ in range(fixes_per_transition):
+            schedule.append((random.randrange(len(driver_ids)), DriverEvent.POSITION))
+    return schedule[:events]
+
+
+def run(engine, driver_ids, schedule):
+    apply = engine.apply
+    started = time.perf_counter()
+    for index, event in schedule:
+        if event == DriverEvent.POSITION:
+            apply(driver_ids[index], event, 1.0, 40.41, -3.70)
+        else:
+            apply(driver_ids[index], event, 1.0)
+    engine.flush_wal()
+    return time.perf_counter() - started
+
+
+def scenario(name, driver_ids, schedule, wal_path=None):
+    engine = DriverStateEngine(capacity=len(driver_ids), wal_path=wal_path)
+    started = time.perf_counter()
+    for driver_id in driver_ids:
+        engine.apply(driver_id, DriverEvent.GO_ONLINE, 0.0)
+    load = time.perf_counter() - started
+    elapsed = run(engine, driver_ids, schedule)
+    row = {
+        "scenario": name,
+        "load_s": round(load, 2),
+        "events": len(schedule),
+        "elapsed_s": round(elapsed, 2),
+        "events_per_s": round(len(schedule) / elapsed),
+        "us_per_event": round(elapsed / len(schedule) * 1e6, 2),
+    }
+    return engine, row
+
+
+def main(args):
+    print(f"⏱️  Generating {args.drivers} drivers and {args.events} events...")
+    driver_ids = [str(uuid.uuid4()) for _ in range(args.drivers)]
+    schedule = build_schedule(driver_ids, args.events, args.fixes_per_transition)
+
+    engine_bytes, naive_bytes = measure_memory(driver_ids)
+    print_table("Memory per driver", [
+        {"store": "DriverStateEngine", "bytes_per_driver": round(engine_bytes),
+         "total_mb": round(engine_bytes * args.drivers / 1e6)},
+        {"store": "dict of dicts", "bytes_per_driver": round(naive_bytes),
+         "total_mb": round(naive_bytes * args.drivers / 1e6)},
+    ], ["store", "bytes_per_driver", "total_mb"])
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        engine, row = scenario("in memory", driver_ids, schedule)
+        rows.append(row)
+        engine.close()
+
+        snapshot_path = os.path.join(tmp, "drivers.snap")
+        wal_path = os.path.join(tmp, "drivers.wal")
+        engine, row = scenario("with WAL", driver_ids, schedule, wal_path)
+        rows.append(row)
+        wal_size = os.path.getsize(wal_path)
+
+        # Recovery from an empty snapshot replays every record of the WAL...
+        started = time.perf_counter()
+        recovered = DriverStateEngine.recover(snapshot_path, wal_path, capacity=args.drivers)
+        replay = time.perf_counter() - started
+        assert recovered.counts() == engine.counts()
+        recovered.close()
+
+        # ...while after a snapshot it only loads the arrays
+        started = time.perf_counter()
+        engine.snapshot(snapshot_path)
+        snapshot = time.perf_counter() - started
+        engine.close()
+        started = time.perf_counter()
+        recovered = DriverStateEngine.recover(snapshot_path, wal_path, capacity=args.drivers)
+        load_snapshot = time.perf_counter() - started
+        recovered.close()
+
+        print_table(
+            f"State engine throughput ({args.drivers} drivers, "
+            f"{args.fixes_per_transition} fixes per transition)",
+            rows,
+            ["scenario", "load_s", "events", "elapsed_s", "events_per_s", "us_per_event"],
+        )
+        print_table("Durability", [
+            {"step": "WAL replay", "seconds": round(replay, 2), "size_mb": round(wal_size / 1e6, 1)},
+            {"step": "snapshot write", "seconds": round(snapshot, 2),
+             "size_mb": round(os.path.getsize(snapshot_path) / 1e6, 1)},
+            {"step": "snapshot load", "seconds": round(load_snapshot, 2), "size_mb": ""},
+        ], ["step", "seconds", "size_mb"])
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--drivers", type=int, default=1_000_000)
+    parser.add_argument("--events", type=int, default=2_000_000)
+    parser.add_argument("--fixes-per-transition", type=int, default=3,
+                        help="position fixes generated for every state transition")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(parse_args())
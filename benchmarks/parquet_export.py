@@ -0,0 +1,154 @@
+"""
+Export throughput and file size of the Parquet analytics exporter.
+
+Generates ``--fixes`` driver-pos records (JSON, as the bridge forwards them)
+for ``--drivers`` drivers reporting every few seconds around two regions, on
+the region topics the bridge routes them to, then runs them through
+``analytics_export``'s ``PositionExporter`` into a temporary dataset. The
+dataset size is compared with the JSON records themselves (what Kafka stores)
+and with gzipped JSON lines, the usual cheap alternative.
+Several Parquet layouts are measured to show what dictionary-encoded driver
+IDs and the codec are worth.
+
+Usage:
+    python benchmarks/parquet_export.py --fixes 1000000 --drivers 20000
+"""
+
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import pyarrow as pa
+
+from _common import print_table
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+sys.path.insert(0, str(ROOT_DIR / "analytics_export"))
+
+from exporter import PositionExporter
+from parquet_sink import POSITIONS_SCHEMA, PartitionedParquetWriter
+from shared.regions import RegionRouter, geohash
+
+CITIES = [("madrid", 40.4168, -3.7038), ("barcelona", 41.3874, 2.1686)]
+
+LAYOUTS = {
+    "zstd, dictionary driver_id": (POSITIONS_SCHEMA, "zstd", True),
+    "snappy, dictionary driver_id": (POSITIONS_SCHEMA, "snappy", True),
+    "zstd, plain string driver_id": (
+        POSITIONS_SCHEMA.set(0, pa.field("driver_id", pa.string())), "zstd", False),
+}
+
+
+def build_router():
+    return RegionRouter({name: {"geohash": [geohash(lat, lon, 3)]} for name, lat, lon in CITIES}, "driver-pos")
+
+
+def generate(args, router):
+    """(topic, JSON value) records."""
+    rng = random.Random(args.seed)
+    drivers = []
+    for i in range(args.drivers):
+        _name, lat, lon = CITIES[i % len(CITIES)]
+        drivers.append([str(uuid.uuid4()), lat + rng.uniform(-0.1, 0.1), lon + rng.uniform(-0.1, 0.1)])
+
+    started = time.time() - args.fixes / args.drivers * 4
+    records = []
+    for n in range(args.fixes):
+        driver = drivers[n % args.drivers]
+        driver[1] += rng.uniform(-0.0005, 0.0005)
+        driver[2] += rng.uniform(-0.0005, 0.0005)
+        timestamp = started + n / args.drivers * 4
+        topic, _partition = router.destination(router.region_for_position(driver[1], driver[2]))
+        records.append((topic, json.dumps({
+            "driver_id": driver[0],
+            "timestamp": timestamp,
+            "lat": driver[1],
+            "lon": driver[2],
+        }).encode("utf-8")))
+    return records
+
+
+def dataset_size(root):
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(root) for f in files)
+
+
+def export(records, layout, args, root, router):
+    schema, compression, use_dictionary = LAYOUTS[layout]
+    writer = PartitionedParquetWriter(root, schema, row_group_size=args.row_group_size,
+                                      max_buffered_rows=args.max_buffered_rows,
+                                      compression=compression, use_dictionary=use_dictionary)
+    exporter = PositionExporter(writer, router)
+    kafka_timestamp = int(time.time() * 1000)
+    peak_buffered = 0
+
+    started = time.perf_counter()
+    for offset, (topic, value) in enumerate(records):
+        exporter.export(value, topic, 0, offset, kafka_timestamp)
+        if writer.buffered_rows > peak_buffered:
+            peak_buffered = writer.buffered_rows
+    writer.close()
+    elapsed = time.perf_counter() - started
+    return elapsed, dataset_size(root), len(writer.files_written), peak_buffered
+
+
+def main(args):
+    print(f"⏱️  Generating {args.fixes} fixes for {args.drivers} drivers...")
+    router = build_router()
+    records = generate(args, router)
+    json_bytes = sum(len(value) for _topic, value in records)
+
+    started = time.perf_counter()
+    gzipped = len(gzip.compress(b"\n".join(value for _topic, value in records), compresslevel=6))
+    gzip_time = time.perf_counter() - started
+
+    rows = [
+        {"format": "JSON records (Kafka)", "seconds": "", "fixes_per_s": "", "files": "",
+         "peak_buffered": "", "mb": round(json_bytes / 1e6, 1), "bytes_per_fix": round(json_bytes / args.fixes, 1),
+         "vs_json": "x1.00"},
+        {"format": "JSON lines, gzip -6", "seconds": round(gzip_time, 2), "fixes_per_s": round(args.fixes / gzip_time),
+         "files": 1, "peak_buffered": "", "mb": round(gzipped / 1e6, 1),
+         "bytes_per_fix": round(gzipped / args.fixes, 1), "vs_json": f"x{json_bytes / gzipped:.2f}"},
+    ]
+    for layout in LAYOUTS:
+        with tempfile.TemporaryDirectory() as root:
+            elapsed, size, files, peak = export(records, layout, args, root, router)
+        rows.append({
+            "format": f"Parquet {layout}",
+            "seconds": round(elapsed, 2),
+            "fixes_per_s": round(args.fixes / elapsed),
+            "files": files,
+            "peak_buffered": peak,
+            "mb": round(size / 1e6, 1),
+            "bytes_per_fix": round(size / args.fixes, 1),
+            "vs_json": f"x{json_bytes / size:.2f}",
+        })
+
+    print_table(
+        f"Position export ({args.fixes} fixes, {args.drivers} drivers, row groups of {args.row_group_size})",
+        rows,
+        ["format", "seconds", "fixes_per_s", "files", "peak_buffered", "mb", "bytes_per_fix", "vs_json"],
+    )
+    print("\nParquet throughput includes JSON decoding, region lookup and partitioning; "
+          "gzip only compresses the already encoded lines.")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--fixes", type=int, default=1_000_000)
+    parser.add_argument("--drivers", type=int, default=20_000)
+    parser.add_argument("--row-group-size", type=int, default=65536)
+    parser.add_argument("--max-buffered-rows", type=int, default=262144)
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(parse_args())
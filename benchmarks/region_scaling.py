@@ -0,0 +1,316 @@
+"""
+End-to-end load test of region-based sharding of driver fixes.
+
+Drives the real ingest path of the compose stack, scenario by scenario:
+
+    MQTT (mosquitto) -> bridge (python_mqtt/main.py) -> region topics (Kafka)
+        -> N driver_events consumers (driver_events/kafka_consumer.py) per region
+
+For every regions x consumers scenario the script starts its own bridge,
+listening on a MQTT topic of its own and producing to a base topic of its own
+(``--topic-prefix`` plus a run id), so the stack's bridge and consumers never
+see the load. Fixes are published on that legacy-style topic and placed by
+the bridge from their position, with the geohash prefix of their city. Region
+topics are created with one partition per consumer, and ``--consumers``
+``kafka_consumer.py`` processes per region (``DRIVER_REGIONS=<region>``,
+one consumer group) share them. Offsets 0 are committed for the group before
+the consumers start, so none of them skips fixes while joining.
+
+Throughput is fixes consumed, read from the group's committed offsets, over
+the time from the first publish until the group has caught up. Consumers
+auto-commit every 5 seconds, so keep scenarios long enough (tens of seconds)
+for that granularity not to matter. Only topic mode is measured: partition
+mode runs a single consumer per region by design.
+
+Consumers run as configured in compose: ``--consumer-mode api`` PATCHes the
+driver API (default, needs uber_driver_api on ``--driver-api-url``),
+``--consumer-mode engine`` applies fixes to the state engine and batches
+them to Postgres (needs ``DATABASE_URL`` and sql/driver_state.sql).
+
+Usage:
+    docker compose up -d uber_kafka uber_mosquitto uber_postgis uber_driver_api
+    python benchmarks/region_scaling.py --regions 1 2 4 --consumers 1 2
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import paho.mqtt.client as mqtt
+from kafka import KafkaConsumer, TopicPartition
+from kafka.admin import KafkaAdminClient, NewTopic
+from kafka.structs import OffsetAndMetadata
+
+from _common import print_table
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from shared.regions import REGION_MODE_TOPIC, RegionRouter, geohash
+
+CITIES = [
+    ("madrid", 40.4168, -3.7038),
+    ("barcelona", 41.3874, 2.1686),
+    ("lisbon", 38.7223, -9.1393),
+    ("paris", 48.8566, 2.3522),
+    ("london", 51.5072, -0.1276),
+    ("berlin", 52.5200, 13.4050),
+    ("rome", 41.9028, 12.4964),
+    ("milan", 45.4642, 9.1900),
+]
+
+
+def region_table(region_count):
+    return {name: {"geohash": [geohash(lat, lon, 3)]} for name, lat, lon in CITIES[:region_count]}
+
+
+class Scenario:
+    """Bridge, topics and consumers of one regions x consumers run."""
+
+    def __init__(self, region_count, consumers, args):
+        self.args = args
+        self.region_count = region_count
+        self.consumers = consumers
+        run_id = uuid.uuid4().hex[:8]
+        self.base_topic = f"{args.topic_prefix}-{run_id}"
+        self.mqtt_topic = f"{args.topic_prefix}/{run_id}"
+        self.group_id = f"{args.topic_prefix}-{run_id}"
+        self.table = region_table(region_count)
+        self.router = RegionRouter(self.table, self.base_topic, REGION_MODE_TOPIC)
+        self.region_topics = self.router.topics_for(self.table)
+        self.workdir = tempfile.mkdtemp(prefix=f"region-scaling-{run_id}-")
+        self.processes = []
+
+    def _env(self, **extra):
+        env = dict(os.environ)
+        env.update(
+            PYTHONPATH=os.pathsep.join(filter(None, [str(ROOT_DIR), env.get("PYTHONPATH")])),
+            KAFKA_BOOTSTRAP_SERVERS=self.args.kafka,
+            KAFKA_TOPIC=self.base_topic,
+            KAFKA_REGION_MODE=REGION_MODE_TOPIC,
+            REGION_TABLE=json.dumps(self.table),
+            ADMISSION_ENABLED="false",
+            DIAGNOSTICS_PORT="",
+        )
+        env.update(extra)
+        return env
+
+    def _spawn(self, name, script, cwd, env):
+        log = open(os.path.join(self.workdir, f"{name}.log"), "w")
+        process = subprocess.Popen([sys.executable, script], cwd=cwd, env=env,
+                                   stdout=log, stderr=subprocess.STDOUT)
+        self.processes.append((name, process, log))
+        return log.name
+
+    def create_topics(self, admin):
+        admin.create_topics([
+            NewTopic(topic, num_partitions=self.consumers, replication_factor=1)
+            for topic in [self.base_topic, f"{self.base_topic}-dlq", *self.region_topics]
+        ])
+        # Committed before any consumer joins, so none of them resets to the end
+        partitions = [TopicPartition(t, p) for t in self.region_topics for p in range(self.consumers)]
+        committer = KafkaConsumer(bootstrap_servers=self.args.kafka, group_id=self.group_id,
+                                  enable_auto_commit=False)
+        committer.assign(partitions)
+        committer.commit({tp: OffsetAndMetadata(0, "", -1) for tp in partitions})
+        committer.close()
+
+    def start_bridge(self):
+        log = self._spawn("bridge", "main.py", ROOT_DIR / "python_mqtt", self._env(
+            MQTT_BROKER_HOST=self.args.mqtt_host,
+            MQTT_BROKER_PORT=str(self.args.mqtt_port),
+            MQTT_TOPIC=self.mqtt_topic,
+            MQTT_CLIENT_ID=f"bridge-{self.group_id}",
+            KAFKA_DEAD_LETTER_TOPIC=f"{self.base_topic}-dlq",
+        ))
+        wait_for(lambda: "Subscribing to topics" in Path(log).read_text(), self.args.startup_timeout,
+                 f"bridge did not subscribe, see {log}")
+        # The subscription is only sent at that point, leave the broker time to register it
+        time.sleep(1)
+
+    def start_consumers(self, admin):
+        for region in self.table:
+            for index in range(self.consumers):
+                name = f"consumer-{region}-{index}"
+                self._spawn(name, "kafka_consumer.py", ROOT_DIR / "driver_events", self._env(
+                    KAFKA_GROUP_ID=self.group_id,
+                    DRIVER_REGIONS=region,
+                    DRIVER_API_URL=self.args.driver_api_url,
+                    STATE_ENGINE_ENABLED="true" if self.args.consumer_mode == "engine" else "false",
+                    STATE_DIR=os.path.join(self.workdir, name),
+                ))
+        expected = self.region_count * self.consumers
+
+        def joined():
+            group = admin.describe_consumer_groups([self.group_id])[0]
+            return group.state == "Stable" and len(group.members) == expected
+
+        wait_for(joined, self.args.startup_timeout, f"consumers did not join, see {self.workdir}")
+
+    def publish(self):
+        """Publish the fixes over MQTT, as driver phones on the legacy topic do."""
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, f"load-{self.group_id}")
+        client.max_inflight_messages_set(self.args.inflight)
+        client.connect(self.args.mqtt_host, self.args.mqtt_port, 60)
+        client.loop_start()
+        rng = random.Random(self.args.seed)
+        drivers = {name: [str(uuid.uuid4()) for _ in range(self.args.drivers_per_region)]
+                   for name in self.table}
+        cities = CITIES[:self.region_count]
+        sent = 0
+        try:
+            for _ in range(self.args.messages_per_region):
+                for name, lat, lon in cities:
+                    payload = json.dumps({
+                        "driver_id": rng.choice(drivers[name]),
+                        "timestamp": time.time(),
+                        "lat": lat + rng.uniform(-0.05, 0.05),
+                        "lon": lon + rng.uniform(-0.05, 0.05),
+                    })
+                    # QoS 1 so the broker acknowledges, paced by the in-flight window
+                    info = client.publish(self.mqtt_topic, payload, qos=1)
+                    sent += 1
+                    if sent % self.args.inflight == 0:
+                        info.wait_for_publish()
+            info.wait_for_publish()
+        finally:
+            client.loop_stop()
+            client.disconnect()
+        return sent
+
+    def offsets(self, admin, probe):
+        """(fixes in the region topics, fixes committed by the group)."""
+        partitions = [TopicPartition(t, p) for t in self.region_topics for p in range(self.consumers)]
+        produced = sum(probe.end_offsets(partitions).values())
+        committed = sum(max(meta.offset, 0) for tp, meta in admin.list_consumer_group_offsets(self.group_id).items()
+                        if tp.topic in self.region_topics)
+        return produced, committed
+
+    def stop(self, admin):
+        for _name, process, log in self.processes:
+            process.terminate()
+        for _name, process, log in self.processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            log.close()
+        if not self.args.keep_topics:
+            admin.delete_topics([self.base_topic, f"{self.base_topic}-dlq", *self.region_topics])
+
+
+def wait_for(condition, timeout, message):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if condition():
+                return
+        except (FileNotFoundError, IndexError):
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(message)
+
+
+def run_scenario(region_count, consumers, args, admin):
+    scenario = Scenario(region_count, consumers, args)
+    probe = KafkaConsumer(bootstrap_servers=args.kafka)
+    try:
+        scenario.create_topics(admin)
+        scenario.start_bridge()
+        scenario.start_consumers(admin)
+
+        started = time.monotonic()
+        sent = scenario.publish()
+        publish_s = time.monotonic() - started
+
+        # Caught up once the bridge has stopped producing and the group committed everything
+        produced = committed = previous = -1
+        deadline = time.monotonic() + args.timeout
+        while time.monotonic() < deadline:
+            produced, committed = scenario.offsets(admin, probe)
+            if produced == previous and committed >= produced:
+                break
+            previous = produced
+            time.sleep(1)
+        drain_s = time.monotonic() - started
+        timed_out = committed < produced
+    finally:
+        probe.close()
+        scenario.stop(admin)
+
+    return {
+        "regions": region_count,
+        "consumers_per_region": consumers,
+        "consumers": region_count * consumers,
+        "sent": sent,
+        "in_kafka": produced,
+        "consumed": committed,
+        "publish_s": round(publish_s, 1),
+        "drain_s": f"{drain_s:.1f}{' (timeout)' if timed_out else ''}",
+        "throughput": round(committed / drain_s),
+        "logs": scenario.workdir,
+    }
+
+
+def main(args):
+    admin = KafkaAdminClient(bootstrap_servers=args.kafka)
+    rows = []
+    try:
+        for region_count in args.regions:
+            for consumers in args.consumers:
+                print(f"⏱️  {region_count} region(s) x {consumers} consumer(s)...")
+                rows.append(run_scenario(region_count, consumers, args, admin))
+    finally:
+        admin.close()
+
+    base = rows[0]
+    for row in rows:
+        row["scaling"] = f"x{row['throughput'] / base['throughput']:.2f}" if base["throughput"] else ""
+        per_consumer = base["throughput"] / base["consumers"]
+        row["efficiency"] = f"{row['throughput'] / (per_consumer * row['consumers']):.0%}" if per_consumer else ""
+
+    print_table(
+        f"Region sharding, MQTT -> bridge -> Kafka -> driver_events ({args.consumer_mode} consumers, "
+        f"{args.messages_per_region} fixes per region)",
+        rows,
+        ["regions", "consumers_per_region", "consumers", "sent", "in_kafka", "consumed",
+         "publish_s", "drain_s", "throughput", "scaling", "efficiency"],
+    )
+    print("\nsent > in_kafka means the bridge dropped fixes (it subscribes at QoS 0); "
+          "logs of every process are kept in the directories below.")
+    for row in rows:
+        print(f"  {row['regions']} x {row['consumers_per_region']}: {row['logs']}")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--regions", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--consumers", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--messages-per-region", type=int, default=20_000)
+    parser.add_argument("--drivers-per-region", type=int, default=5_000)
+    parser.add_argument("--consumer-mode", choices=("api", "engine"), default="api")
+    parser.add_argument("--kafka", default=os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092"))
+    parser.add_argument("--mqtt-host", default="localhost")
+    parser.add_argument("--mqtt-port", type=int, default=1883)
+    parser.add_argument("--driver-api-url", default=os.getenv("DRIVER_API_URL", "http://localhost:8002"))
+    parser.add_argument("--topic-prefix", default="loadtest")
+    parser.add_argument("--inflight", type=int, default=1000, help="unacknowledged MQTT publishes")
+    parser.add_argument("--startup-timeout", type=float, default=60)
+    parser.add_argument("--timeout", type=float, default=600, help="seconds to wait for the consumers to catch up")
+    parser.add_argument("--keep-topics", action="store_true")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    if max(args.regions) > len(CITIES):
+        parser.error(f"at most {len(CITIES)} regions are available")
+    return args
+
+
+if __name__ == "__main__":
+    main(parse_args())
@@ -1,27 +1,25 @@
+import asyncio
 import os
+from contextlib import asynccontextmanager
+
 import asyncpg
 from fastapi import FastAPI, HTTPException, Depends, Body
 from pydantic import BaseModel
-from typing import Optional
 from uuid import UUID
 from datetime import datetime
 from dotenv import load_dotenv
-from pydantic_settings import BaseSettings
 
 load_dotenv()
 
-class Settings(BaseSettings):
-    database_url: str = os.getenv("DATABASE_URL")
-
-settings = Settings()
-
-db_pool: Optional[asyncpg.Pool] = None
+from shared.database import Database, health_router
+from shared.diagnostics import start_diagnostics
+from shared.queries import UPDATE_DRIVER_LOCATION_SQL
 
-async def get_db_connection() -> asyncpg.Connection:
-    if not db_pool:
-        raise HTTPException(status_code=503, detail="Database connection is not available.")
-    async with db_pool.acquire() as connection:
-        yield connection
+# Port uvicorn serves on, see the command in docker-compose.yml
+PORT = int(os.getenv("PORT", 8002))
+# The probe moves a driver that cannot exist, so it updates no row
+database = Database(statements={"update_driver_location": UPDATE_DRIVER_LOCATION_SQL},
+                    probe=("update_driver_location", (0.0, 0.0, UUID(int=0))))
 
 class GeoPositionUpdate(BaseModel):
     latitude: float
@@ -37,27 +35,30 @@ class DriverStatusResponse(BaseModel):
     geoposition: DriverLocation
     last_updated_at: datetime
 
-app = FastAPI(
-    title="Driver Geoposition Service",
-    description="An isolated service to update driver locations.",
-    version="1.0.0"
-)
-
-@app.on_event("startup")
-async def startup_event():
-    global db_pool
+@asynccontextmanager
+async def lifespan(app: FastAPI):
     try:
-        db_pool = await asyncpg.create_pool(settings.database_url)
+        await database.connect()
         print("Driver service connected to database.")
     except Exception as e:
         print(f"🔥 Driver service failed to connect to database: {e}")
-        db_pool = None
+    # Off unless DIAGNOSTICS_PORT is set, and never on the public port
+    diagnostics = start_diagnostics("driver_api", public_ports=(PORT,))
+    if diagnostics:
+        diagnostics.watch_loop(asyncio.get_running_loop())
+    yield
+    if diagnostics:
+        diagnostics.stop()
+    await database.close()
+    print("Driver service database connection pool closed.")
 
-@app.on_event("shutdown")
-async def shutdown_event():
-    if db_pool:
-        await db_pool.close()
-        print("Driver service database connection pool closed.")
+app = FastAPI(
+    title="Driver Geoposition Service",
+    description="An isolated service to update driver locations.",
+    version="1.0.0",
+    lifespan=lifespan
+)
+app.include_router(health_router(database))
 
 @app.patch("/drivers/{driver_id}/location",
            response_model=DriverStatusResponse,
@@ -66,23 +67,9 @@ async def shutdown_event():
 async def update_driver_location(
     driver_id: UUID,
     location_update: GeoPositionUpdate = Body(...),
-    db: asyncpg.Connection = Depends(get_db_connection)
+    db: asyncpg.Connection = Depends(database.connection)
 ):
-    query = """
-        UPDATE driver_status
-        SET
-            geoposition = ST_SetSRID(ST_MakePoint($1, $2), 4326),
-            last_updated_at = NOW()
-        WHERE driver_id = $3 and is_active = TRUE
-        RETURNING
-            driver_id,
-            is_active,
-            last_updated_at,
-            ST_Y(geoposition::geometry) as latitude,
-            ST_X(geoposition::geometry) as longitude;
-    """
-    record = await db.fetchrow(
-        query,
+    record = await db.statement("update_driver_location").fetchrow(
         location_update.longitude,
         location_update.latitude,
         driver_id
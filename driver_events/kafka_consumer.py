@@ -1,22 +1,47 @@
+import asyncio
 import json
 import logging
 import os
+import re
+import time
 
 import requests
 from dotenv import load_dotenv
-from kafka import KafkaConsumer
+from kafka import KafkaConsumer, TopicPartition
 from kafka.errors import KafkaError
 
+from shared.admission import PRIORITY_ACTIVE, PRIORITY_IDLE, ActiveDrivers, AdmissionController
+from shared.diagnostics import start_diagnostics
+from shared.regions import REGION_MODE_PARTITION, RegionRouter
+from state_engine import IN_PROGRESS_STATES, DriverEvent, DriverStateEngine
+
 logging.basicConfig(
     level=logging.INFO,
     format='[%(asctime)s] :: %(levelname)s :: %(message)s'
 )
 load_dotenv()
 KAFKA_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092")
-KAFKA_TOPIC = os.getenv("KAFKA_TOPIC", "driver-pos,")
+KAFKA_TOPIC = os.getenv("KAFKA_TOPIC", "driver-pos")
+KAFKA_GROUP_ID = os.getenv("KAFKA_GROUP_ID", "driver-events")
+# Regions this instance consumes, all of them when empty
+DRIVER_REGIONS = [r.strip() for r in os.getenv("DRIVER_REGIONS", "").split(",") if r.strip()]
 DRIVER_API_URL = os.getenv("DRIVER_API_URL", "http://localhost:8002")
+# In-process driver state machine, persisted in batches instead of one PATCH per fix
+STATE_ENGINE_ENABLED = os.getenv("STATE_ENGINE_ENABLED", "false").lower() in ("1", "true", "yes")
+STATE_DIR = os.getenv("STATE_DIR", "state")
+STATE_SNAPSHOT_INTERVAL = float(os.getenv("STATE_SNAPSHOT_INTERVAL", 300))
+STATE_PERSIST_INTERVAL = float(os.getenv("STATE_PERSIST_INTERVAL", 1))
+DATABASE_URL = os.getenv("DATABASE_URL")
 logger = logging.getLogger('kafka_consumer')
 
+# Set by main() when STATE_ENGINE_ENABLED, see start_state_engine()
+engine = None
+persister = None
+# Sheds idle drivers' fixes when the consumer lags, see shared/admission.py
+admission = AdmissionController.from_env()
+# Drivers with an in_progress delivery, when the state engine is not there to tell
+active_drivers = ActiveDrivers.from_env() if admission is not None and not STATE_ENGINE_ENABLED else None
+
 
 def update_driver_location(driver_id: str, lat: float, lon: float):
     url = f"{DRIVER_API_URL}/drivers/{driver_id}/location"
@@ -37,41 +62,191 @@ def update_driver_location(driver_id: str, lat: float, lon: float):
         logger.info(f"🔥 API Request Error for driver {driver_id}: {e}")
 
 
+def process_event(data: dict):
+    """Apply a state event such as {"driver_id": ..., "event": "assign", "timestamp": ...}."""
+    try:
+        event = DriverEvent[data['event'].upper()]
+        engine.apply(data['driver_id'], event, float(data.get('timestamp') or time.time()))
+    except (KeyError, AttributeError, TypeError, ValueError) as e:
+        # InvalidTransition is a ValueError too
+        logger.info(f"⚠️  Skipping state event {data}: {e}")
+
+
+def process_fix(data: dict):
+    """Handle one decoded position fix. Also the entry point of the GPS replayer."""
+    if engine is not None and 'event' in data:
+        process_event(data)
+    elif 'driver_id' in data and 'lat' in data and 'lon' in data:
+        if engine is not None:
+            try:
+                engine.apply(data['driver_id'], DriverEvent.POSITION, float(data.get('timestamp') or time.time()),
+                             float(data['lat']), float(data['lon']))
+            except (AttributeError, TypeError, ValueError) as e:
+                # A null coordinate, a driver_id that is no UUID string or an invalid transition
+                logger.info(f"⚠️  Skipping fix {data}: {e}")
+            return
+        update_driver_location(
+            driver_id=data['driver_id'],
+            lat=data['lat'],
+            lon=data['lon']
+        )
+    else:
+        logger.info(f"⚠️  Skipping malformed message: {data}")
+
+
+def fix_priority(data: dict) -> str:
+    """Active when the driver's delivery is in progress: from the state engine if on, else from Postgres."""
+    if engine is not None:
+        return PRIORITY_ACTIVE if engine.state(data['driver_id']) in IN_PROGRESS_STATES else PRIORITY_IDLE
+    if active_drivers is not None:
+        return active_drivers.priority(data['driver_id'])
+    return PRIORITY_IDLE
+
+
+def admit_fix(data: dict) -> bool:
+    """Whether admission control lets a fix through. State events always go through."""
+    if admission is None or 'event' in data or 'driver_id' not in data:
+        return True
+    timestamp = data.get('timestamp')
+    if isinstance(timestamp, (int, float)):
+        admission.observe_latency(time.time() - timestamp)
+    try:
+        priority = fix_priority(data)
+    except (AttributeError, TypeError, ValueError):
+        # driver_id is no UUID string, let process_fix report it
+        return True
+    return admission.admit(priority, str(data['driver_id']))
+
+
+def consumer_lag(consumer: KafkaConsumer) -> int:
+    """Messages behind the end of the assigned partitions, as far as the last fetch knows."""
+    lag = 0
+    for partition in consumer.assignment():
+        highwater = consumer.highwater(partition)
+        if highwater is not None:
+            lag += max(0, highwater - consumer.position(partition))
+    return lag
+
+
+def subscribe(consumer: KafkaConsumer, router: RegionRouter, regions: list):
+    """
+    Subscribe to the fixes of ``regions``, or of every region when empty.
+
+    In topic mode instances sharing KAFKA_GROUP_ID split each region topic's
+    partitions between them. In partition mode the region partitions are
+    assigned explicitly, so run a single instance per region.
+    """
+    if router.mode == REGION_MODE_PARTITION:
+        if not regions:
+            consumer.subscribe([router.base_topic])
+            return f"topic '{router.base_topic}'"
+        partitions = router.partitions_for(regions)
+        consumer.assign([TopicPartition(router.base_topic, p) for p in partitions])
+        return f"partitions {partitions} of '{router.base_topic}'"
+
+    if not regions:
+        # The base topic plus every <base>.<region> topic, current and future
+        pattern = f"^{re.escape(router.base_topic)}(\\..+)?$"
+        consumer.subscribe(pattern=pattern)
+        return f"topics matching {pattern}"
+    topics = router.topics_for(regions)
+    consumer.subscribe(topics)
+    return f"topics {topics}"
+
+
+def start_state_engine():
+    """Recover the engine from its snapshot and WAL, seeding it from Postgres on first start."""
+    global engine, persister
+    # Only needed with the engine on, so the replayer can import this module without asyncpg
+    from state_persistence import StatePersister, load_states
+
+    os.makedirs(STATE_DIR, exist_ok=True)
+    snapshot_path = os.path.join(STATE_DIR, "drivers.snap")
+    wal_path = os.path.join(STATE_DIR, "drivers.wal")
+    first_start = not os.path.exists(snapshot_path) and not os.path.exists(wal_path)
+
+    engine = DriverStateEngine.recover(snapshot_path, wal_path)
+    if first_start:
+        engine.load_states(asyncio.run(load_states(DATABASE_URL)))
+        engine.snapshot(snapshot_path)
+    logger.info(f"🧠 State engine ready with {len(engine)} drivers: {engine.counts()}")
+
+    persister = StatePersister(DATABASE_URL, interval=STATE_PERSIST_INTERVAL)
+    persister.start()
+    return snapshot_path
+
+
 def main():
     logger.info("🚦 Kafka consumer starting...")
-    logger.info(f"Connecting to Kafka at {KAFKA_SERVERS} on topic '{KAFKA_TOPIC}'")
+    router = RegionRouter.from_env(KAFKA_TOPIC)
 
     try:
         consumer = KafkaConsumer(
-            KAFKA_TOPIC,
             bootstrap_servers=KAFKA_SERVERS,
+            group_id=KAFKA_GROUP_ID,
         )
+        subscription = subscribe(consumer, router, DRIVER_REGIONS)
     except KafkaError as e:
         logger.info(f"🚨 Could not connect to Kafka: {e}")
         return
+    logger.info(f"Connected to Kafka at {KAFKA_SERVERS} on {subscription}")
+
+    snapshot_path = start_state_engine() if STATE_ENGINE_ENABLED else None
+    if active_drivers is not None:
+        active_drivers.start()
+    diagnostics = start_diagnostics("driver_events")
+    last_snapshot = last_admission_report = time.monotonic()
 
     logger.info("✅ Consumer connected. Waiting for messages...")
 
     try:
         logger.info("Waiting for messages... Press Ctrl+C to stop.")
 
-        for message in consumer:
-            data = json.loads(message.value.decode('utf-8'))
-            logger.info(f"\n📩 Received message: {data}")
-
-            if 'driver_id' in data and 'lat' in data and 'lon' in data:
-                update_driver_location(
-                    driver_id=data['driver_id'],
-                    lat=data['lat'],
-                    lon=data['lon']
-                )
-            else:
-                logger.info(f"⚠️  Skipping malformed message: {data}")
+        while True:
+            batches = consumer.poll(timeout_ms=1000)
+            if admission is not None:
+                admission.observe_queue_depth(consumer_lag(consumer))
+            for messages in batches.values():
+                for message in messages:
+                    try:
+                        data = json.loads(message.value.decode('utf-8'))
+                    except ValueError as e:
+                        logger.info(f"⚠️  Skipping undecodable message at offset {message.offset}: {e}")
+                        continue
+                    if not isinstance(data, dict):
+                        logger.info(f"⚠️  Skipping malformed message: {data}")
+                        continue
+                    if not admit_fix(data):
+                        continue
+                    if engine is None:
+                        logger.info(f"\n📩 Received message: {data}")
+                    process_fix(data)
+
+            if engine is not None:
+                # The WAL reaches disk once per poll, like the batches reach Postgres
+                engine.flush_wal()
+                persister.submit(engine.drain_dirty())
+                if time.monotonic() - last_snapshot >= STATE_SNAPSHOT_INTERVAL:
+                    engine.snapshot(snapshot_path)
+                    last_snapshot = time.monotonic()
+
+            if admission is not None and time.monotonic() - last_admission_report >= 60:
+                logger.info(f"🚥 Admission control: {admission.stats()}")
+                last_admission_report = time.monotonic()
 
     except KeyboardInterrupt:
         logger.info("\n🛑 Consumer stopped by user.")
     finally:
         consumer.close()
+        if engine is not None:
+            persister.submit(engine.drain_dirty())
+            persister.stop()
+            engine.snapshot(snapshot_path)
+            engine.close()
+        if active_drivers is not None:
+            active_drivers.stop()
+        if diagnostics:
+            diagnostics.stop()
         logger.info("✅ Consumer closed.")
 
 
@@ -0,0 +1,303 @@
+"""
+In-process driver state machine.
+
+Keeps the state and last position of every driver in flat arrays indexed by
+an integer slot, with a dict from the driver's 16 byte UUID to its slot, so a
+million drivers fit in a couple of hundred megabytes and a transition is a
+table lookup plus a few array writes.
+
+Durability follows the usual snapshot + write-ahead log scheme: every applied
+event is appended to the WAL with an increasing sequence number, snapshots
+store the arrays together with the last sequence they include, and recovery
+loads the snapshot and replays the newer WAL records.
+"""
+
+import os
+import struct
+from array import array
+from enum import IntEnum
+from typing import Dict, List, Optional, Tuple
+
+
+class DriverState(IntEnum):
+    OFFLINE = 0
+    IDLE = 1
+    HEADING_TO_RESTAURANT = 2
+    PICKED_UP = 3
+    DELIVERING = 4
+
+
+# States of a driver whose delivery is in_progress in driver_delivers
+IN_PROGRESS_STATES = frozenset({
+    DriverState.PICKED_UP,
+    DriverState.DELIVERING,
+})
+
+
+class DriverEvent(IntEnum):
+    POSITION = 0
+    GO_ONLINE = 1
+    GO_OFFLINE = 2
+    ASSIGN = 3
+    PICK_UP = 4
+    DEPART = 5
+    COMPLETE = 6
+    CANCEL = 7
+
+
+TRANSITIONS = {
+    (DriverState.OFFLINE, DriverEvent.GO_ONLINE): DriverState.IDLE,
+    # A fix from an offline driver means the app came back online
+    (DriverState.OFFLINE, DriverEvent.POSITION): DriverState.IDLE,
+    (DriverState.IDLE, DriverEvent.GO_OFFLINE): DriverState.OFFLINE,
+    (DriverState.IDLE, DriverEvent.ASSIGN): DriverState.HEADING_TO_RESTAURANT,
+    (DriverState.HEADING_TO_RESTAURANT, DriverEvent.PICK_UP): DriverState.PICKED_UP,
+    (DriverState.HEADING_TO_RESTAURANT, DriverEvent.CANCEL): DriverState.IDLE,
+    (DriverState.PICKED_UP, DriverEvent.DEPART): DriverState.DELIVERING,
+    (DriverState.PICKED_UP, DriverEvent.CANCEL): DriverState.IDLE,
+    (DriverState.DELIVERING, DriverEvent.COMPLETE): DriverState.IDLE,
+    (DriverState.DELIVERING, DriverEvent.CANCEL): DriverState.IDLE,
+}
+# Position updates never change the state of an online driver
+for _state in DriverState:
+    if _state is not DriverState.OFFLINE:
+        TRANSITIONS[(_state, DriverEvent.POSITION)] = _state
+
+_INVALID = 0xFF
+_EVENTS = len(DriverEvent)
+# Flat [state * events + event] -> next state table, 0xFF for invalid pairs
+_NEXT = bytearray([_INVALID]) * (len(DriverState) * _EVENTS)
+for (_state, _event), _next in TRANSITIONS.items():
+    _NEXT[_state * _EVENTS + _event] = _next
+
+WAL_RECORD = struct.Struct("<Q16sBddd")
+SNAPSHOT_MAGIC = b"DRVSNAP1"
+SNAPSHOT_HEADER = struct.Struct("<8sQQ")
+
+NaN = float("nan")
+
+
+class InvalidTransition(ValueError):
+    """Raised when an event is not allowed in the driver's current state."""
+
+    def __init__(self, driver_id: str, state: DriverState, event: DriverEvent):
+        super().__init__(f"{event.name} is not valid for driver {driver_id} in state {state.name}")
+        self.driver_id = driver_id
+        self.state = state
+        self.event = event
+
+
+def driver_key(driver_id: str) -> bytes:
+    """16 byte key of a UUID string, cheaper than going through uuid.UUID."""
+    return bytes.fromhex(driver_id.replace("-", ""))
+
+
+def driver_id_from_key(key: bytes) -> str:
+    h = key.hex()
+    return f"{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}"
+
+
+class DriverStateEngine:
+    """
+    Array-backed state store for every driver.
+
+    Args:
+        capacity (int): Slots allocated up front, grown by doubling when full.
+        wal_path (str, optional): Write-ahead log to append applied events to.
+    """
+
+    def __init__(self, capacity: int = 1 << 20, wal_path: Optional[str] = None):
+        self._slots: Dict[bytes, int] = {}
+        self._keys: List[bytes] = []
+        self._capacity = capacity
+        self.states = bytearray(capacity)
+        self.lat = array("d", [NaN]) * capacity
+        self.lon = array("d", [NaN]) * capacity
+        self.updated_at = array("d", [0.0]) * capacity
+        # A flag per slot plus the list of flagged slots: a set of ints would
+        # cost more than every other per-driver structure together
+        self._dirty_flags = bytearray(capacity)
+        self._dirty = array("L")
+        self.sequence = 0
+        self.wal_path = wal_path
+        self._wal = open(wal_path, "ab") if wal_path else None
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _grow(self):
+        extra = self._capacity
+        self.states.extend(bytes(extra))
+        self.lat.extend(array("d", [NaN]) * extra)
+        self.lon.extend(array("d", [NaN]) * extra)
+        self.updated_at.extend(array("d", [0.0]) * extra)
+        self._dirty_flags.extend(bytes(extra))
+        self._capacity += extra
+
+    def _slot(self, key: bytes) -> int:
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = len(self._keys)
+            if slot == self._capacity:
+                self._grow()
+            self._slots[key] = slot
+            self._keys.append(key)
+        return slot
+
+    def state(self, driver_id: str) -> DriverState:
+        slot = self._slots.get(driver_key(driver_id))
+        return DriverState.OFFLINE if slot is None else DriverState(self.states[slot])
+
+    def position(self, driver_id: str) -> Optional[Tuple[float, float]]:
+        slot = self._slots.get(driver_key(driver_id))
+        if slot is None or self.lat[slot] != self.lat[slot]:
+            return None
+        return self.lat[slot], self.lon[slot]
+
+    def apply(self, driver_id: str, event: DriverEvent, timestamp: float,
+              lat: float = NaN, lon: float = NaN) -> DriverState:
+        """
+        Apply an event to a driver and log it to the WAL.
+
+        Returns:
+            DriverState: The driver's new state.
+
+        Raises:
+            InvalidTransition: If the event is not allowed in the current state.
+        """
+        key = driver_key(driver_id)
+        next_state = self._apply(key, event, timestamp, lat, lon)
+        if next_state == _INVALID:
+            slot = self._slots[key]
+            raise InvalidTransition(driver_id, DriverState(self.states[slot]), DriverEvent(event))
+        if self._wal:
+            self._wal.write(WAL_RECORD.pack(self.sequence, key, event, timestamp, lat, lon))
+        return DriverState(next_state)
+
+    def _apply(self, key: bytes, event: int, timestamp: float, lat: float, lon: float) -> int:
+        slot = self._slot(key)
+        next_state = _NEXT[self.states[slot] * _EVENTS + event]
+        if next_state == _INVALID:
+            return _INVALID
+        self.states[slot] = next_state
+        if lat == lat:
+            self.lat[slot] = lat
+            self.lon[slot] = lon
+        self.updated_at[slot] = timestamp
+        if not self._dirty_flags[slot]:
+            self._dirty_flags[slot] = 1
+            self._dirty.append(slot)
+        self.sequence += 1
+        return next_state
+
+    def counts(self) -> Dict[str, int]:
+        counts = [0] * len(DriverState)
+        for state in self.states[:len(self._keys)]:
+            counts[state] += 1
+        return {state.name.lower(): counts[state] for state in DriverState}
+
+    def drain_dirty(self) -> List[tuple]:
+        """
+        Rows changed since the last call, for batched persistence.
+
+        Returns:
+            list: (driver_id, state name, lat, lon, updated_at) tuples, NaN positions as None.
+        """
+        rows = []
+        for slot in self._dirty:
+            self._dirty_flags[slot] = 0
+            lat = self.lat[slot]
+            has_position = lat == lat
+            rows.append((
+                driver_id_from_key(self._keys[slot]),
+                DriverState(self.states[slot]).name.lower(),
+                lat if has_position else None,
+                self.lon[slot] if has_position else None,
+                self.updated_at[slot],
+            ))
+        del self._dirty[:]
+        return rows
+
+    def load_states(self, rows):
+        """Seed the engine with (driver_id, DriverState) pairs, e.g. from Postgres."""
+        for driver_id, state in rows:
+            self.states[self._slot(driver_key(driver_id))] = state
+
+    def flush_wal(self):
+        if self._wal:
+            self._wal.flush()
+
+    def snapshot(self, path: str):
+        """Atomically write every driver to ``path`` and start a new WAL."""
+        count = len(self._keys)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, count, self.sequence))
+            f.write(b"".join(self._keys))
+            f.write(self.states[:count])
+            self.lat[:count].tofile(f)
+            self.lon[:count].tofile(f)
+            self.updated_at[:count].tofile(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+        # Records up to self.sequence are in the snapshot. If we crash before
+        # the truncate, recovery skips them by sequence number.
+        if self._wal:
+            self._wal.close()
+            self._wal = open(self.wal_path, "wb")
+
+    @classmethod
+    def recover(cls, snapshot_path: str, wal_path: Optional[str] = None,
+                capacity: int = 1 << 20) -> "DriverStateEngine":
+        """Rebuild an engine from a snapshot (if any) and the WAL written after it."""
+        engine = cls(capacity=capacity)
+        if snapshot_path and os.path.exists(snapshot_path):
+            engine._load_snapshot(snapshot_path)
+        if wal_path and os.path.exists(wal_path):
+            engine._replay_wal(wal_path)
+        engine.wal_path = wal_path
+        engine._wal = open(wal_path, "ab") if wal_path else None
+        # Write everything back once, Postgres may have missed the last batches.
+        # Drivers only seeded by load_states() have no event yet (updated_at 0)
+        # and nothing to write back.
+        updated_at = engine.updated_at
+        engine._dirty = array("L", (slot for slot in range(len(engine)) if updated_at[slot] > 0))
+        for slot in engine._dirty:
+            engine._dirty_flags[slot] = 1
+        return engine
+
+    def _load_snapshot(self, path: str):
+        with open(path, "rb") as f:
+            magic, count, sequence = SNAPSHOT_HEADER.unpack(f.read(SNAPSHOT_HEADER.size))
+            if magic != SNAPSHOT_MAGIC:
+                raise ValueError(f"{path}: not a driver state snapshot")
+            while self._capacity < count:
+                self._grow()
+            keys = f.read(16 * count)
+            self._keys = [keys[i:i + 16] for i in range(0, 16 * count, 16)]
+            self._slots = {key: slot for slot, key in enumerate(self._keys)}
+            self.states[:count] = f.read(count)
+            for column in (self.lat, self.lon, self.updated_at):
+                loaded = array("d")
+                loaded.fromfile(f, count)
+                column[:count] = loaded
+            self.sequence = sequence
+
+    def _replay_wal(self, path: str):
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(WAL_RECORD.size * 4096)
+                usable = len(chunk) - len(chunk) % WAL_RECORD.size
+                if not usable:
+                    break
+                for sequence, key, event, timestamp, lat, lon in WAL_RECORD.iter_unpack(chunk[:usable]):
+                    if sequence <= self.sequence:
+                        continue
+                    self._apply(key, event, timestamp, lat, lon)
+
+    def close(self):
+        if self._wal:
+            self._wal.close()
+            self._wal = None
@@ -0,0 +1,148 @@
+"""
+Batched Postgres persistence for the driver state engine.
+
+The consumer thread hands over the rows the engine changed; a background
+thread with its own asyncio loop merges them by driver and writes the latest
+version of each one with a single UPDATE ... FROM unnest() per interval, so
+the database sees one statement per batch instead of one round-trip per
+transition. If Postgres falls behind, pending rows keep being coalesced, so
+memory is bounded by the number of drivers rather than by the event rate.
+"""
+
+import asyncio
+import logging
+import threading
+from typing import Dict, List
+
+import asyncpg
+
+from state_engine import DriverState
+
+logger = logging.getLogger('state_persistence')
+
+PERSIST_STATES_SQL = """
+UPDATE driver_status AS ds
+SET state = b.state,
+    is_active = b.state <> 'offline',
+    geoposition = CASE
+        WHEN b.lat IS NULL THEN ds.geoposition
+        ELSE ST_SetSRID(ST_MakePoint(b.lon, b.lat), 4326)
+    END,
+    -- 0 is a driver seeded by load_states() without an event yet
+    last_updated_at = CASE
+        WHEN b.updated_at > 0 THEN to_timestamp(b.updated_at)
+        ELSE ds.last_updated_at
+    END
+FROM unnest($1::uuid[], $2::text[], $3::float8[], $4::float8[], $5::float8[])
+    AS b(driver_id, state, lat, lon, updated_at)
+WHERE ds.driver_id = b.driver_id
+"""
+
+# Seeds the engine when there is no snapshot yet. A driver with several open
+# deliveries takes the most advanced one.
+LOAD_STATES_SQL = """
+SELECT ds.driver_id::text AS driver_id,
+       ds.is_active,
+       bool_or(dd.delivery_status = 'in_progress') AS delivering,
+       bool_or(dd.delivery_status = 'assigned') AS assigned
+FROM driver_status ds
+LEFT JOIN driver_delivers dd
+    ON dd.driver_id = ds.driver_id AND dd.delivery_status IN ('assigned', 'in_progress')
+GROUP BY ds.driver_id, ds.is_active
+"""
+
+
+async def load_states(database_url: str) -> List[tuple]:
+    """(driver_id, DriverState) pairs derived from driver_status and open deliveries."""
+    conn = await asyncpg.connect(database_url)
+    try:
+        rows = await conn.fetch(LOAD_STATES_SQL)
+    finally:
+        await conn.close()
+
+    states = []
+    for row in rows:
+        if row['delivering']:
+            state = DriverState.DELIVERING
+        elif row['assigned']:
+            state = DriverState.HEADING_TO_RESTAURANT
+        elif row['is_active']:
+            state = DriverState.IDLE
+        else:
+            state = DriverState.OFFLINE
+        states.append((row['driver_id'], state))
+    return states
+
+
+class StatePersister:
+    """
+    Writes engine rows to driver_status from a background thread.
+
+    Args:
+        database_url (str): Postgres DSN.
+        interval (float): Seconds between batches.
+        batch_size (int): Most rows written per statement.
+    """
+
+    def __init__(self, database_url: str, interval: float = 1.0, batch_size: int = 5000):
+        self.database_url = database_url
+        self.interval = interval
+        self.batch_size = batch_size
+        self.written = 0
+        self._pending: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="state-persister", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def submit(self, rows: List[tuple]):
+        """Queue rows from DriverStateEngine.drain_dirty(), newest wins per driver."""
+        if not rows:
+            return
+        with self._lock:
+            for row in rows:
+                self._pending[row[0]] = row
+
+    def stop(self, timeout: float = 10.0):
+        """Write what is pending and stop the thread."""
+        self._stop.set()
+        self._thread.join(timeout)
+
+    def _take(self) -> List[tuple]:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return list(pending.values())
+
+    def _run(self):
+        asyncio.run(self._loop())
+
+    async def _loop(self):
+        pool = await asyncpg.create_pool(self.database_url, min_size=1, max_size=2)
+        logger.info("💾 State persister connected to Postgres")
+        try:
+            while True:
+                stopping = self._stop.wait(self.interval)
+                rows = self._take()
+                if rows:
+                    await self._write(pool, rows)
+                if stopping:
+                    break
+        finally:
+            await pool.close()
+
+    async def _write(self, pool, rows: List[tuple]):
+        for start in range(0, len(rows), self.batch_size):
+            batch = rows[start:start + self.batch_size]
+            try:
+                async with pool.acquire() as conn:
+                    await conn.execute(PERSIST_STATES_SQL, *map(list, zip(*batch)))
+            except (asyncpg.PostgresError, OSError) as e:
+                logger.info(f"🔥 Could not persist {len(batch)} driver states: {e}")
+                # Put them back unless a newer row arrived meanwhile
+                with self._lock:
+                    for row in batch:
+                        self._pending.setdefault(row[0], row)
+                continue
+            self.written += len(batch)
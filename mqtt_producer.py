@@ -8,6 +8,9 @@ from faker import Faker
 MQTT_BROKER_HOST = "localhost"
 MQTT_BROKER_PORT = 1883
 MQTT_TOPIC = "sensor/data"
+# Set to a region of the region table (e.g. "madrid") to publish on
+# drivers/<region>/<driver_id>/pos instead of MQTT_TOPIC
+MQTT_REGION = None
 client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, "sensor_producer")
 
 
@@ -28,11 +31,39 @@ client.on_publish = on_publish
 
 client.on_connect = on_connect
 _faker = Faker()
-lat, lon = _faker.latlng()
-drivers = json.loads(open("drivers.json").read())
-random_driver = random.choice(drivers)
+
+
+def fix_topic(driver_id, region=None):
+    region = region or MQTT_REGION
+    if region:
+        return f"drivers/{region}/{driver_id}/pos"
+    return MQTT_TOPIC
+
+
+def publish_fix(mqtt_client, driver_id, lat, lon, timestamp=None, region=None):
+    """
+    Publish one position fix the way a driver's phone does.
+
+    Also used by the GPS replayer (replay/play.py).
+
+    Returns:
+        tuple: (topic, payload JSON, paho MQTTMessageInfo)
+    """
+    topic = fix_topic(driver_id, region)
+    payload = {
+        "driver_id": driver_id,
+        "timestamp": time.time() if timestamp is None else timestamp,
+        "lat": float(lat),
+        "lon": float(lon)
+    }
+    payload_json = json.dumps(payload)
+    return topic, payload_json, mqtt_client.publish(topic, payload_json)
+
 
 def main():
+    lat, lon = _faker.latlng()
+    drivers = json.loads(open("drivers.json").read())
+    random_driver = random.choice(drivers)
     try:
         print(f"🔌 Connecting to MQTT Broker at {MQTT_BROKER_HOST}:{MQTT_BROKER_PORT}...")
         client.connect(MQTT_BROKER_HOST, MQTT_BROKER_PORT, 60)
@@ -47,22 +78,14 @@ def main():
 
     try:
         while True:
-            payload = {
-                "driver_id": random_driver,
-                "timestamp": time.time(),
-                "lat": float(lat),
-                "lon": float(lon)
-            }
-
-            payload_json = json.dumps(payload)
-            result = client.publish(MQTT_TOPIC, payload_json)
+            topic, payload_json, result = publish_fix(client, random_driver, lat, lon)
             status = result.rc
 
             if status == 0:
-                print(f"✉️  Sent `{payload_json}` to topic `{MQTT_TOPIC}`")
+                print(f"✉️  Sent `{payload_json}` to topic `{topic}`")
                 break
             else:
-                print(f"Failed to send message to topic {MQTT_TOPIC}. Error code: {status}")
+                print(f"Failed to send message to topic {topic}. Error code: {status}")
 
             time.sleep(2)
 
@@ -2,8 +2,13 @@ import os
 
 MQTT_BROKER_HOST = os.environ.get("MQTT_BROKER_HOST", "localhost")
 MQTT_BROKER_PORT = int(os.environ.get("MQTT_BROKER_PORT", 1883))
-MQTT_TOPIC = os.environ.get("MQTT_TOPIC", "sensor/data")
+# Comma separated; drivers/<region>/<driver_id>/pos carries the region in the topic
+MQTT_TOPIC = os.environ.get("MQTT_TOPIC", "sensor/data,drivers/+/+/pos")
 MQTT_CLIENT_ID = os.environ.get("MQTT_CLIENT_ID", "mqtt_kafka_bridge")
 
 KAFKA_BOOTSTRAP_SERVERS = os.environ.get("KAFKA_BOOTSTRAP_SERVERS", 'localhost:9092')
 KAFKA_TOPIC = os.environ.get("KAFKA_TOPIC", 'driver-pos')
+KAFKA_DEAD_LETTER_TOPIC = os.environ.get("KAFKA_DEAD_LETTER_TOPIC", 'driver-pos-dlq')
+
+# Forward validated payloads untouched instead of parsing and re-serializing them
+BRIDGE_PASSTHROUGH = os.environ.get("BRIDGE_PASSTHROUGH", "true").lower() in ("1", "true", "yes")
@@ -3,7 +3,7 @@ import logging
 from kafka import KafkaProducer
 from kafka.errors import NoBrokersAvailable
 
-from config import KAFKA_BOOTSTRAP_SERVERS
+from config import KAFKA_BOOTSTRAP_SERVERS, KAFKA_DEAD_LETTER_TOPIC
 
 logger = logging.getLogger('mqtt_kafka_bridge')
 
@@ -12,6 +12,9 @@ class KafkaProducerWrapper:
 
     def __init__(self, bootstrap_servers=None):
         self.bootstrap_servers = bootstrap_servers or KAFKA_BOOTSTRAP_SERVERS
+        # Each counter is only written by one thread: the caller and the producer's I/O thread
+        self.sent = 0
+        self.completed = 0
         self.producer = self._create_producer()
 
     def _create_producer(self):
@@ -19,7 +22,6 @@ class KafkaProducerWrapper:
             logger.info("🔄 Initializing Kafka Producer...")
             producer = KafkaProducer(
                 bootstrap_servers=[self.bootstrap_servers],
-                value_serializer=lambda v: json.dumps(v).encode('utf-8')
             )
             logger.info("✅ Kafka Producer Initialized.")
             return producer
@@ -33,13 +35,13 @@ class KafkaProducerWrapper:
             logger.error(f"❌ Failed to create Kafka producer: {e}")
             return None
 
-    def send_message(self, topic, message):
+    def send_message(self, topic, message, partition=None):
         if not self.producer:
             logger.warning("⚠️ Kafka producer not available, message not forwarded")
             return False
 
         try:
-            self.producer.send(topic, value=message)
+            self.producer.send(topic, value=json.dumps(message).encode('utf-8'), partition=partition)
             self.producer.flush()
             logger.info(f"➡️ Forwarded to Kafka topic '{topic}'")
             return True
@@ -47,6 +49,45 @@ class KafkaProducerWrapper:
             logger.error(f"❌ Error sending message to Kafka: {e}")
             return False
 
+    def send_raw(self, topic, value, key=None, headers=None, partition=None):
+        """
+        Forward already encoded bytes without re-serializing them.
+
+        The send is not flushed, the producer batches it in the background and
+        delivery errors are reported from its callback.
+        """
+        if not self.producer:
+            logger.warning("⚠️ Kafka producer not available, message not forwarded")
+            return False
+
+        try:
+            future = self.producer.send(topic, value=value, key=key, headers=headers, partition=partition)
+            self.sent += 1
+            future.add_both(self._on_send_done, topic)
+            logger.debug("➡️ Forwarded to Kafka topic '%s'", topic)
+            return True
+        except Exception as e:
+            logger.error(f"❌ Error sending message to Kafka: {e}")
+            return False
+
+    def send_dead_letter(self, payload, reason, source_topic, topic=None):
+        """Route a payload that could not be forwarded to the dead-letter topic."""
+        headers = [
+            ('error', reason.encode('utf-8')),
+            ('source_topic', source_topic.encode('utf-8')),
+        ]
+        return self.send_raw(topic or KAFKA_DEAD_LETTER_TOPIC, payload, headers=headers)
+
+    @property
+    def in_flight(self):
+        """Records handed to the producer and not yet acknowledged or failed."""
+        return self.sent - self.completed
+
+    def _on_send_done(self, topic, result):
+        self.completed += 1
+        if isinstance(result, Exception):
+            logger.error(f"❌ Error sending message to Kafka topic '{topic}': {result}")
+
     def close(self):
         if self.producer:
             self.producer.close()
@@ -4,12 +4,14 @@ import logging
 from logger import setup_logger
 from kafka_producer import KafkaProducerWrapper
 from mqtt_client import MQTTClient
+from shared.diagnostics import start_diagnostics
 
 
 def main():
     logger = setup_logger()
 
     logger.info("Starting MQTT-Kafka bridge...")
+    diagnostics = start_diagnostics("mqtt_kafka_bridge")
     kafka_producer = KafkaProducerWrapper()
     if not kafka_producer.producer:
         logger.error("❌ Failed to create Kafka producer. Exiting.")
@@ -32,6 +34,8 @@ def main():
     finally:
         mqtt_client.disconnect()
         kafka_producer.close()
+        if diagnostics:
+            diagnostics.stop()
         logger.info("✅ MQTT-Kafka bridge shut down.")
 
     return 0
@@ -7,6 +7,8 @@ that forwards messages to Kafka.
 
 import json
 import logging
+import time
+
 import paho.mqtt.client as mqtt
 
 from config import (
@@ -14,8 +16,12 @@ from config import (
     MQTT_BROKER_PORT,
     MQTT_TOPIC,
     MQTT_CLIENT_ID,
-    KAFKA_TOPIC
+    KAFKA_TOPIC,
+    BRIDGE_PASSTHROUGH
 )
+from payload import InvalidPayload, validate_fix
+from shared.admission import PRIORITY_IDLE, ActiveDrivers, AdmissionController
+from shared.regions import RegionRouter, parse_fix_topic
 
 logger = logging.getLogger('mqtt_kafka_bridge')
 
@@ -28,7 +34,8 @@ class MQTTClient:
     """
 
     def __init__(self, kafka_producer, broker_host=None, broker_port=None, 
-                 topic=None, client_id=None):
+                 topic=None, client_id=None, passthrough=None, router=None, admission=None,
+                 active_drivers=None):
         """
         Initialize the MQTT client.
 
@@ -36,14 +43,30 @@ class MQTTClient:
             kafka_producer: Kafka producer instance to forward messages to
             broker_host (str, optional): MQTT broker host. Defaults to config value.
             broker_port (int, optional): MQTT broker port. Defaults to config value.
-            topic (str, optional): MQTT topic to subscribe to. Defaults to config value.
+            topic (str, optional): Comma separated MQTT topics to subscribe to. Defaults to config value.
             client_id (str, optional): MQTT client ID. Defaults to config value.
+            passthrough (bool, optional): Forward validated payload bytes untouched
+                instead of parsing and re-serializing them. Defaults to config value.
+            router (RegionRouter, optional): Maps fixes to their region's Kafka
+                topic or partition. Defaults to the region table in the environment.
+            admission (AdmissionController, optional): Sheds idle drivers' fixes when the
+                bridge falls behind. Defaults to the ADMISSION_* environment, off unless enabled.
+            active_drivers (ActiveDrivers, optional): Drivers whose fixes admission control
+                keeps. Defaults to a set refreshed from DATABASE_URL when admission is on.
         """
         self.kafka_producer = kafka_producer
         self.broker_host = broker_host or MQTT_BROKER_HOST
         self.broker_port = broker_port or MQTT_BROKER_PORT
         self.topic = topic or MQTT_TOPIC
+        self.topics = [t.strip() for t in self.topic.split(',') if t.strip()]
         self.client_id = client_id or MQTT_CLIENT_ID
+        self.passthrough = BRIDGE_PASSTHROUGH if passthrough is None else passthrough
+        self.router = router or RegionRouter.from_env(KAFKA_TOPIC)
+        self.admission = admission if admission is not None else AdmissionController.from_env()
+        if active_drivers is None and self.admission is not None:
+            active_drivers = ActiveDrivers.from_env()
+        self.active_drivers = active_drivers
+        self._last_admission_report = time.monotonic()
 
         # Create MQTT client
         self.client = mqtt.Client(
@@ -70,8 +93,8 @@ class MQTTClient:
         """
         if rc == 0:
             logger.info("✅ Successfully connected to MQTT Broker!")
-            logger.info(f"👂 Subscribing to topic: {self.topic}")
-            client.subscribe(self.topic)
+            logger.info(f"👂 Subscribing to topics: {', '.join(self.topics)}")
+            client.subscribe([(topic, 0) for topic in self.topics])
         else:
             logger.error(f"❌ Failed to connect to MQTT broker, return code {rc}")
 
@@ -87,27 +110,108 @@ class MQTTClient:
             *args: Variable length argument list
             **kwargs: Arbitrary keyword arguments
         """
+        kafka_producer = userdata.get('kafka_producer')
+        if not kafka_producer:
+            logger.warning("⚠️ Kafka producer not available, message not forwarded")
+            return
+
         try:
-            logger.info(f"📩 Received message on topic {msg.topic}")
-            payload = msg.payload.decode('utf-8')
+            if self.passthrough:
+                self._forward_passthrough(kafka_producer, msg)
+            else:
+                self._forward_parsed(kafka_producer, msg)
+        except Exception as e:
+            logger.error(f"❌ Error processing message: {e}")
 
-            # Try to parse as JSON
-            try:
-                payload_dict = json.loads(payload)
-                logger.info(f"📦 Message payload: {payload_dict}")
+    def _forward_passthrough(self, kafka_producer, msg):
+        """
+        Validate a fix and forward the original payload bytes, keyed by driver ID.
 
-                # Forward to Kafka
-                kafka_producer = userdata.get('kafka_producer')
-                if kafka_producer:
-                    kafka_producer.send_message(KAFKA_TOPIC, payload_dict)
-                else:
-                    logger.warning("⚠️ Kafka producer not available, message not forwarded")
+        Args:
+            kafka_producer: Kafka producer wrapper to forward the message with
+            msg: Received MQTT message
+        """
+        try:
+            fix = validate_fix(msg.payload)
+            self._check_topic_driver(msg.topic, fix['driver_id'])
+        except InvalidPayload as e:
+            logger.warning(f"⚠️ Dead-lettering message from topic {msg.topic}: {e}")
+            kafka_producer.send_dead_letter(msg.payload, str(e), msg.topic)
+            return
 
-            except json.JSONDecodeError:
-                logger.warning(f"⚠️ Could not decode JSON from payload: {payload}")
+        if self.admission and not self._admit(kafka_producer, fix):
+            return
 
-        except Exception as e:
-            logger.error(f"❌ Error processing message: {e}")
+        topic, partition = self.router.destination(self.router.resolve(msg.topic, fix.get('lat'), fix.get('lon')))
+        kafka_producer.send_raw(topic, msg.payload, key=fix['driver_id'].encode('utf-8'), partition=partition)
+
+    def _admit(self, kafka_producer, fix):
+        """
+        Feed the fix's age and the producer backlog to admission control and ask it.
+        State events always go through, as in driver_events.
+
+        Args:
+            kafka_producer: Kafka producer wrapper, for its in-flight count
+            fix (dict): Decoded fix
+
+        Returns:
+            bool: False if the fix is shed.
+        """
+        if 'event' in fix:
+            return True
+        admission = self.admission
+        timestamp = fix.get('timestamp')
+        if isinstance(timestamp, (int, float)):
+            admission.observe_latency(time.time() - timestamp)
+        admission.observe_queue_depth(kafka_producer.in_flight)
+        driver_id = str(fix.get('driver_id'))
+        priority = self.active_drivers.priority(driver_id) if self.active_drivers else PRIORITY_IDLE
+        admitted = admission.admit(priority, driver_id)
+
+        now = time.monotonic()
+        if now - self._last_admission_report >= 60:
+            self._last_admission_report = now
+            logger.info(f"🚥 Admission control: {admission.stats()}")
+        return admitted
+
+    @staticmethod
+    def _check_topic_driver(mqtt_topic, driver_id):
+        """
+        Reject fixes published on another driver's topic.
+
+        Raises:
+            InvalidPayload: If the topic's driver ID differs from the payload's.
+        """
+        parsed = parse_fix_topic(mqtt_topic)
+        if parsed and parsed[1] != driver_id:
+            raise InvalidPayload(f"driver_id {driver_id} does not match topic {mqtt_topic}")
+
+    def _forward_parsed(self, kafka_producer, msg):
+        """
+        Decode a message to a dict and forward it re-serialized.
+
+        Args:
+            kafka_producer: Kafka producer wrapper to forward the message with
+            msg: Received MQTT message
+        """
+        logger.info(f"📩 Received message on topic {msg.topic}")
+        try:
+            payload_dict = json.loads(msg.payload.decode('utf-8'))
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            logger.warning(f"⚠️ Could not decode JSON from payload: {msg.payload!r}")
+            kafka_producer.send_dead_letter(msg.payload, f"invalid JSON: {e}", msg.topic)
+            return
+        if not isinstance(payload_dict, dict):
+            logger.warning(f"⚠️ Payload is not a JSON object: {msg.payload!r}")
+            kafka_producer.send_dead_letter(msg.payload, "payload is not a JSON object", msg.topic)
+            return
+
+        logger.info(f"📦 Message payload: {payload_dict}")
+        if self.admission and not self._admit(kafka_producer, payload_dict):
+            return
+        region = self.router.resolve(msg.topic, payload_dict.get('lat'), payload_dict.get('lon'))
+        topic, partition = self.router.destination(region)
+        kafka_producer.send_message(topic, payload_dict, partition=partition)
 
     def _on_disconnect(self, client, userdata, rc, properties=None, *args, **kwargs):
         """
@@ -149,6 +253,8 @@ class MQTTClient:
         This method blocks until disconnect() is called or an error occurs.
         """
         try:
+            if self.active_drivers:
+                self.active_drivers.start()
             logger.info("🔄 Starting MQTT client loop...")
             self.client.loop_forever()
         except KeyboardInterrupt:
@@ -161,4 +267,6 @@ class MQTTClient:
     def disconnect(self):
         """Disconnect from the MQTT broker."""
         self.client.disconnect()
+        if self.active_drivers:
+            self.active_drivers.stop()
         logger.info("✅ MQTT client disconnected.")
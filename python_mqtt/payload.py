@@ -0,0 +1,81 @@
+"""
+Validation of driver position payloads for the bridge passthrough path.
+
+The passthrough path only needs to know that a payload is a usable fix and
+which driver it belongs to; the original bytes are forwarded to Kafka as they
+arrived. orjson is used for the check when it is installed, falling back to
+the standard library otherwise.
+
+State events for the driver_events state engine, such as
+``{"driver_id": ..., "event": "assign", "timestamp": ...}``, travel the same
+way and need no position.
+"""
+
+import json
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    orjson = None
+    _loads = json.loads
+
+REQUIRED_FIELDS = ("driver_id", "lat", "lon", "timestamp")
+REQUIRED_EVENT_FIELDS = ("driver_id", "event")
+
+
+class InvalidPayload(ValueError):
+    """Raised when an MQTT payload is not a usable driver position fix."""
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def validate_fix(payload):
+    """
+    Check that a raw payload is a driver position fix.
+
+    Args:
+        payload (bytes): Raw MQTT message payload.
+
+    Returns:
+        dict: The decoded fix.
+
+    Raises:
+        InvalidPayload: If the payload is not JSON or misses or mistypes a required field.
+            State events (with an ``event`` field) need no lat, lon or timestamp.
+    """
+    try:
+        fix = _loads(payload)
+    except ValueError as e:
+        raise InvalidPayload(f"invalid JSON: {e}") from e
+
+    if not isinstance(fix, dict):
+        raise InvalidPayload("payload is not a JSON object")
+
+    is_event = "event" in fix
+    missing = [field for field in (REQUIRED_EVENT_FIELDS if is_event else REQUIRED_FIELDS) if field not in fix]
+    if missing:
+        raise InvalidPayload(f"missing fields: {', '.join(missing)}")
+
+    driver_id = fix["driver_id"]
+    if not isinstance(driver_id, str) or not driver_id:
+        raise InvalidPayload("driver_id must be a non-empty string")
+
+    if is_event:
+        if not isinstance(fix["event"], str) or not fix["event"]:
+            raise InvalidPayload("event must be a non-empty string")
+        if fix.get("timestamp") is not None and not _is_number(fix["timestamp"]):
+            raise InvalidPayload(f"timestamp is not a number: {fix['timestamp']!r}")
+        return fix
+
+    lat, lon = fix["lat"], fix["lon"]
+    if not _is_number(lat) or not -90.0 <= lat <= 90.0:
+        raise InvalidPayload(f"lat out of range: {lat!r}")
+    if not _is_number(lon) or not -180.0 <= lon <= 180.0:
+        raise InvalidPayload(f"lon out of range: {lon!r}")
+    if not _is_number(fix["timestamp"]):
+        raise InvalidPayload(f"timestamp is not a number: {fix['timestamp']!r}")
+
+    return fix
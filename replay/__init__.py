@@ -0,0 +1 @@
+"""Record and replay of driver GPS streams for load and regression testing."""
@@ -0,0 +1,181 @@
+"""
+Compact, append-only capture files for driver position fixes.
+
+A capture is a 16 byte header followed by fixed-size 56 byte records:
+
+    header:  magic "UBERGPS1" | version u32 | record size u32
+    record:  captured_at f64 | timestamp f64 | lat f64 | lon f64 |
+             driver_id 16 bytes (UUID) | flags u32 | 4 bytes padding
+
+All values are little-endian. ``captured_at`` is when the recorder saw the
+fix and never goes backwards within a file, so the fixed record size doubles
+as the index: record ``n`` lives at ``16 + n * 56`` and a binary search on
+``captured_at`` finds any point in time without reading the file. ``flags``
+is reserved for per-fix markers and written as 0.
+
+A writer re-opening an existing capture drops a trailing partial record left
+by a crash and keeps appending.
+"""
+
+import os
+import struct
+import uuid
+from typing import BinaryIO, Iterator, NamedTuple, Optional
+
+MAGIC = b"UBERGPS1"
+VERSION = 1
+HEADER = struct.Struct("<8sII")
+RECORD = struct.Struct("<dddd16sI4x")
+
+# Records read per chunk when streaming, ~230KB of buffer
+CHUNK_RECORDS = 4096
+
+
+class CaptureError(ValueError):
+    """Raised when a file is not a capture this module can read."""
+
+
+class Fix(NamedTuple):
+    captured_at: float
+    timestamp: float
+    lat: float
+    lon: float
+    driver_id: str
+    flags: int = 0
+
+
+def _check_header(raw: bytes, path):
+    if len(raw) < HEADER.size:
+        raise CaptureError(f"{path}: truncated header")
+    magic, version, record_size = HEADER.unpack(raw[:HEADER.size])
+    if magic != MAGIC:
+        raise CaptureError(f"{path}: not a GPS capture")
+    if version != VERSION or record_size != RECORD.size:
+        raise CaptureError(f"{path}: unsupported capture version {version} (record size {record_size})")
+
+
+class CaptureWriter:
+    """
+    Appends fixes to a capture file.
+
+    Args:
+        path (str): Capture file, created when missing.
+        flush_every (int): Records buffered before they are flushed to disk.
+    """
+
+    def __init__(self, path, flush_every=1000):
+        self.path = path
+        self.flush_every = flush_every
+        self.records = 0
+        self._pending = 0
+        self._last_captured_at = 0.0
+        self._file = self._open()
+
+    def _open(self) -> BinaryIO:
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            f = open(self.path, "wb")
+            f.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+            f.flush()
+            return f
+
+        f = open(self.path, "r+b")
+        _check_header(f.read(HEADER.size), self.path)
+        size = os.fstat(f.fileno()).st_size
+        self.records = (size - HEADER.size) // RECORD.size
+        end = HEADER.size + self.records * RECORD.size
+        if end != size:
+            f.truncate(end)
+        if self.records:
+            f.seek(end - RECORD.size)
+            self._last_captured_at = RECORD.unpack(f.read(RECORD.size))[0]
+        f.seek(end)
+        return f
+
+    def append(self, captured_at: float, timestamp: float, lat: float, lon: float,
+               driver_id: str, flags: int = 0):
+        """
+        Append one fix.
+
+        Raises:
+            ValueError: If ``driver_id`` is not a UUID.
+        """
+        # Keep the time index monotonic even if the wall clock steps back
+        captured_at = max(captured_at, self._last_captured_at)
+        self._file.write(RECORD.pack(captured_at, timestamp, lat, lon, uuid.UUID(driver_id).bytes, flags))
+        self._last_captured_at = captured_at
+        self.records += 1
+        self._pending += 1
+        if self._pending >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        self._file.flush()
+        self._pending = 0
+
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CaptureReader:
+    """Streams fixes from a capture file with constant memory."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        _check_header(self._file.read(HEADER.size), path)
+        self.records = (os.fstat(self._file.fileno()).st_size - HEADER.size) // RECORD.size
+
+    def _captured_at(self, index: int) -> float:
+        self._file.seek(HEADER.size + index * RECORD.size)
+        return struct.unpack("<d", self._file.read(8))[0]
+
+    def find(self, captured_at: float) -> int:
+        """Index of the first record captured at or after ``captured_at``."""
+        lo, hi = 0, self.records
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._captured_at(mid) < captured_at:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def time_range(self):
+        """(first, last) capture times, or None for an empty capture."""
+        if not self.records:
+            return None
+        return self._captured_at(0), self._captured_at(self.records - 1)
+
+    def iter_fixes(self, start: Optional[float] = None, end: Optional[float] = None) -> Iterator[Fix]:
+        """Yield fixes captured in [start, end), reading the file in chunks."""
+        index = self.find(start) if start is not None else 0
+        chunk_size = CHUNK_RECORDS * RECORD.size
+        # A handle of its own, so find() and time_range() stay usable meanwhile
+        with open(self.path, "rb") as f:
+            f.seek(HEADER.size + index * RECORD.size)
+            while True:
+                chunk = f.read(chunk_size)
+                usable = len(chunk) - len(chunk) % RECORD.size
+                if not usable:
+                    return
+                for captured_at, timestamp, lat, lon, driver, flags in RECORD.iter_unpack(chunk[:usable]):
+                    if end is not None and captured_at >= end:
+                        return
+                    yield Fix(captured_at, timestamp, lat, lon, str(uuid.UUID(bytes=driver)), flags)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
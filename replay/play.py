@@ -0,0 +1,206 @@
+"""
+Replays capture files into MQTT, Kafka or driver_events processing.
+
+Sinks:
+    mqtt           publish like a driver's phone, through mqtt_producer.publish_fix
+    kafka          produce to the region topics, bypassing MQTT and the bridge
+    driver-events  call driver_events' process_fix directly, bypassing Kafka
+
+--speed 1 replays in real time, --speed N N times faster and --speed 0 as fast
+as possible. Gaps longer than --max-gap (e.g. between capture files) are
+skipped instead of waited for. Files are streamed in chunks, so memory stays
+constant whatever the size of the capture.
+
+Usage:
+    python -m replay.play captures/*.ugps --sink mqtt --speed 1
+    python -m replay.play captures/*.ugps --sink kafka --speed 10 --retime
+    python -m replay.play capture.ugps --sink driver-events --speed 0
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from collections import deque
+
+from dotenv import load_dotenv
+
+from replay.capture import CaptureReader
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='[%(asctime)s] :: %(levelname)s :: %(message)s'
+)
+load_dotenv()
+logger = logging.getLogger('gps_replayer')
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class Pacer:
+    """Sleeps so fixes go out with their captured spacing divided by ``speed``."""
+
+    def __init__(self, speed, max_gap):
+        self.speed = speed
+        self.max_gap = max_gap
+        self._origin = None
+        self._previous = None
+
+    def wait(self, captured_at):
+        if self.speed <= 0:
+            return
+        if self._origin is None or captured_at - self._previous > self.max_gap:
+            self._origin = (captured_at, time.monotonic())
+        self._previous = captured_at
+        delay = self._origin[1] + (captured_at - self._origin[0]) / self.speed - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class MqttSink:
+    def __init__(self, args):
+        import paho.mqtt.client as mqtt
+        import mqtt_producer
+
+        self._publish_fix = mqtt_producer.publish_fix
+        self.region = args.region
+        self.max_queued = args.max_queued
+        # Fixes handed to paho but not written to the socket yet. paho does not
+        # bound QoS 0 messages itself, so waiting on the oldest keeps memory flat.
+        self._pending = deque()
+        self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, "gps_replayer")
+        logger.info(f"🔌 Connecting to MQTT Broker at {args.mqtt_host}:{args.mqtt_port}...")
+        self.client.connect(args.mqtt_host, args.mqtt_port, 60)
+        self.client.loop_start()
+        # QoS 0 fixes published before the CONNACK would be dropped
+        deadline = time.monotonic() + 30
+        while not self.client.is_connected():
+            if time.monotonic() > deadline:
+                raise ConnectionError("MQTT broker did not accept the connection")
+            time.sleep(0.05)
+
+    def send(self, fix, timestamp):
+        _topic, _payload, info = self._publish_fix(
+            self.client, fix.driver_id, fix.lat, fix.lon, timestamp, self.region)
+        self._pending.append(info)
+        while self._pending and self._pending[0].is_published():
+            self._pending.popleft()
+        while len(self._pending) >= self.max_queued:
+            self._pending.popleft().wait_for_publish()
+
+    def close(self):
+        while self._pending:
+            self._pending.popleft().wait_for_publish()
+        self.client.loop_stop()
+        self.client.disconnect()
+
+
+class KafkaSink:
+    def __init__(self, args):
+        from kafka import KafkaProducer
+        from shared.regions import RegionRouter
+
+        topic = os.getenv("KAFKA_TOPIC", "driver-pos")
+        servers = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092")
+        self.router = RegionRouter.from_env(topic)
+        # send() blocks once buffer_memory is used up, which bounds memory
+        self.producer = KafkaProducer(bootstrap_servers=[servers])
+        logger.info(f"🔌 Producing to Kafka at {servers}")
+
+    def send(self, fix, timestamp):
+        topic, partition = self.router.destination(self.router.region_for_position(fix.lat, fix.lon))
+        value = json.dumps({
+            "driver_id": fix.driver_id,
+            "timestamp": timestamp,
+            "lat": fix.lat,
+            "lon": fix.lon,
+        }).encode('utf-8')
+        self.producer.send(topic, value=value, key=fix.driver_id.encode('utf-8'), partition=partition)
+
+    def close(self):
+        self.producer.flush()
+        self.producer.close()
+
+
+class DriverEventsSink:
+    def __init__(self, args):
+        sys.path.insert(0, os.path.join(ROOT_DIR, "driver_events"))
+        import kafka_consumer
+
+        self._process_fix = kafka_consumer.process_fix
+
+    def send(self, fix, timestamp):
+        self._process_fix({
+            "driver_id": fix.driver_id,
+            "timestamp": timestamp,
+            "lat": fix.lat,
+            "lon": fix.lon,
+        })
+
+    def close(self):
+        pass
+
+
+SINKS = {
+    "mqtt": MqttSink,
+    "kafka": KafkaSink,
+    "driver-events": DriverEventsSink,
+}
+
+
+def replay(paths, sink, args):
+    pacer = Pacer(args.speed, args.max_gap)
+    sent = 0
+    started = time.monotonic()
+    last_report = started
+
+    for path in paths:
+        with CaptureReader(path) as reader:
+            logger.info(f"▶️  Replaying {reader.records} fixes from {path}")
+            for fix in reader.iter_fixes(args.start, args.end):
+                pacer.wait(fix.captured_at)
+                if args.retime:
+                    # Same age as when it was captured, but relative to now
+                    timestamp = time.time() - (fix.captured_at - fix.timestamp)
+                else:
+                    timestamp = fix.timestamp
+                sink.send(fix, timestamp)
+                sent += 1
+
+                now = time.monotonic()
+                if now - last_report >= 10:
+                    logger.info(f"📈 {sent} fixes replayed ({sent / (now - started):.0f}/s)")
+                    last_report = now
+
+    elapsed = time.monotonic() - started
+    logger.info(f"✅ Replayed {sent} fixes in {elapsed:.1f}s ({sent / elapsed if elapsed else 0:.0f}/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay GPS capture files.")
+    parser.add_argument("paths", nargs="+", help="capture files, replayed in the given order")
+    parser.add_argument("--sink", choices=sorted(SINKS), default="mqtt")
+    parser.add_argument("--speed", type=float, default=1.0, help="1 real time, N accelerated, 0 as fast as possible")
+    parser.add_argument("--max-gap", type=float, default=5.0, help="longest pause replayed, in capture seconds")
+    parser.add_argument("--start", type=float, help="first capture time to replay (epoch seconds)")
+    parser.add_argument("--end", type=float, help="capture time to stop at (epoch seconds)")
+    parser.add_argument("--retime", action="store_true", help="shift fix timestamps to the replay time")
+    parser.add_argument("--region", help="mqtt sink: publish on drivers/<region>/<driver_id>/pos")
+    parser.add_argument("--mqtt-host", default=os.getenv("MQTT_BROKER_HOST", "localhost"))
+    parser.add_argument("--mqtt-port", type=int, default=int(os.getenv("MQTT_BROKER_PORT", 1883)))
+    parser.add_argument("--max-queued", type=int, default=10_000, help="mqtt sink: fixes waiting to be written to the socket")
+    args = parser.parse_args()
+
+    sink = SINKS[args.sink](args)
+    try:
+        replay(args.paths, sink, args)
+    except KeyboardInterrupt:
+        logger.info("🛑 Replay stopped by user.")
+    finally:
+        sink.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Records the driver-pos stream to capture files.
+
+Taps Kafka downstream of the bridge with a consumer group of its own, so the
+driver_events consumers keep all their partitions. Every fix is appended to a
+capture file (see replay.capture) stamped with its Kafka timestamp; files are
+rotated once they reach --max-bytes.
+
+Usage:
+    python -m replay.record --output-dir captures
+    python -m replay.record --output-dir captures --regions madrid --max-bytes 1073741824
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import time
+
+from dotenv import load_dotenv
+from kafka import KafkaConsumer
+
+from replay.capture import RECORD, CaptureWriter
+from shared.regions import RegionRouter
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='[%(asctime)s] :: %(levelname)s :: %(message)s'
+)
+load_dotenv()
+KAFKA_SERVERS = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "localhost:9092")
+KAFKA_TOPIC = os.getenv("KAFKA_TOPIC", "driver-pos")
+logger = logging.getLogger('gps_recorder')
+
+
+def open_capture(output_dir):
+    name = time.strftime("capture-%Y%m%dT%H%M%SZ.ugps", time.gmtime())
+    path = os.path.join(output_dir, name)
+    logger.info(f"📼 Recording to {path}")
+    return CaptureWriter(path)
+
+
+def create_consumer(args):
+    router = RegionRouter.from_env(KAFKA_TOPIC)
+    consumer = KafkaConsumer(
+        bootstrap_servers=KAFKA_SERVERS,
+        group_id=args.group_id,
+        auto_offset_reset=args.offset_reset,
+    )
+    if args.regions:
+        consumer.subscribe(router.topics_for(args.regions))
+    else:
+        consumer.subscribe(pattern=f"^{re.escape(KAFKA_TOPIC)}(\\..+)?$")
+    return consumer
+
+
+def record(consumer, args):
+    os.makedirs(args.output_dir, exist_ok=True)
+    writer = open_capture(args.output_dir)
+    max_records = args.max_bytes // RECORD.size
+    recorded = skipped = 0
+    last_report = time.monotonic()
+
+    try:
+        while True:
+            batches = consumer.poll(timeout_ms=1000)
+            for messages in batches.values():
+                for message in messages:
+                    try:
+                        fix = json.loads(message.value)
+                        writer.append(
+                            message.timestamp / 1000.0,
+                            float(fix['timestamp']),
+                            float(fix['lat']),
+                            float(fix['lon']),
+                            fix['driver_id'],
+                        )
+                    except (ValueError, KeyError, TypeError) as e:
+                        skipped += 1
+                        logger.warning(f"⚠️ Skipping unrecordable message: {e}")
+                        continue
+                    recorded += 1
+                    if writer.records >= max_records:
+                        writer.close()
+                        writer = open_capture(args.output_dir)
+            # Fixes reach disk at least once per poll, even on a quiet stream
+            writer.flush()
+
+            if time.monotonic() - last_report >= 10:
+                logger.info(f"📈 {recorded} fixes recorded, {skipped} skipped")
+                last_report = time.monotonic()
+    finally:
+        writer.close()
+        logger.info(f"✅ Recording stopped: {recorded} fixes recorded, {skipped} skipped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record the driver-pos stream to capture files.")
+    parser.add_argument("--output-dir", default="captures")
+    parser.add_argument("--regions", nargs="*", default=[], help="regions to record, all when omitted")
+    parser.add_argument("--max-bytes", type=int, default=1 << 30, help="rotate capture files at this size")
+    parser.add_argument("--group-id", default="gps-recorder")
+    parser.add_argument("--offset-reset", choices=["latest", "earliest"], default="latest",
+                        help="where a new recorder group starts reading")
+    args = parser.parse_args()
+
+    consumer = create_consumer(args)
+    try:
+        record(consumer, args)
+    except KeyboardInterrupt:
+        logger.info("🛑 Recorder stopped by user.")
+    finally:
+        consumer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Code shared between the services, copied into each image at build time."""
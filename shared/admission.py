@@ -0,0 +1,274 @@
+"""
+Priority-aware admission control for the ingest path.
+
+Fixes fall in two classes: ``active`` drivers, with an ``in_progress``
+delivery, and ``idle`` ones. The class comes from server-side state, never
+from the fix itself, so a client cannot exempt itself from shedding: the
+driver_events state engine when it runs, else ``ActiveDrivers``, the set of
+drivers with an in_progress row in driver_delivers refreshed from Postgres
+every few seconds. The controller watches the stage it protects through two
+signals, its queue depth (producer buffer, consumer lag) and the age of the
+fixes it handles (an EWMA of now - fix timestamp). When either goes over its
+target the stage is saturated until both are back under a fraction of it:
+
+    - active fixes keep flowing, capped only by their own token bucket
+    - idle fixes are sampled down to one per driver every
+      ``idle_sample_interval`` seconds, and the idle token bucket caps what
+      is left
+
+Everything that is not admitted is counted per class. Settings are read from
+the environment by ``AdmissionController.from_env``:
+
+    ADMISSION_ENABLED                "true" to turn shedding on (default false)
+    ADMISSION_MAX_QUEUE_DEPTH        queue depth considered saturated (10000)
+    ADMISSION_LATENCY_TARGET         fix age in seconds considered saturated (2)
+    ADMISSION_ACTIVE_RATE            active fixes/s always allowed, 0 unlimited (0)
+    ADMISSION_IDLE_RATE              idle fixes/s allowed while saturated, 0 unlimited (500)
+    ADMISSION_IDLE_SAMPLE_INTERVAL   seconds between admitted fixes of an idle driver (30)
+
+``ActiveDrivers.from_env`` reads DATABASE_URL and ACTIVE_DRIVERS_REFRESH_INTERVAL
+(seconds, 5).
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, FrozenSet, Optional
+
+PRIORITY_ACTIVE = "active"
+PRIORITY_IDLE = "idle"
+PRIORITIES = (PRIORITY_ACTIVE, PRIORITY_IDLE)
+
+# Delivery status of the driver_delivers table that makes a driver active
+ACTIVE_DELIVERY_STATUS = "in_progress"
+
+ACTIVE_DRIVERS_SQL = f"""
+SELECT DISTINCT driver_id::text AS driver_id
+FROM driver_delivers
+WHERE delivery_status = '{ACTIVE_DELIVERY_STATUS}' AND driver_id IS NOT NULL
+"""
+
+logger = logging.getLogger('admission')
+
+
+class TokenBucket:
+    """
+    Classic token bucket: ``rate`` tokens per second up to ``burst`` tokens.
+
+    A rate of 0 means unlimited.
+    """
+
+    __slots__ = ("rate", "burst", "tokens", "_updated", "_clock")
+
+    def __init__(self, rate: float, burst: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1.0)
+        self.tokens = self.burst
+        self._clock = clock
+        self._updated = clock()
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        if not self.rate:
+            return True
+        now = self._clock()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+
+class ActiveDrivers:
+    """
+    IDs of the drivers with an in_progress delivery, refreshed from Postgres in a daemon thread.
+
+    The whole set is swapped at once, so ``priority`` is a lock-free set lookup
+    from any thread. Until the first refresh, and while Postgres cannot be
+    reached, the last known set is used.
+
+    Args:
+        database_url (str): Postgres DSN.
+        interval (float): Seconds between refreshes.
+    """
+
+    def __init__(self, database_url: str, interval: float = 5.0):
+        self.database_url = database_url
+        self.interval = interval
+        self.drivers: FrozenSet[str] = frozenset()
+        self.refreshed_at = 0.0
+        self.errors = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="active-drivers", daemon=True)
+
+    @classmethod
+    def from_env(cls) -> Optional["ActiveDrivers"]:
+        """Set refreshed from DATABASE_URL, or None when it is not configured."""
+        database_url = os.environ.get("DATABASE_URL")
+        if not database_url:
+            logger.warning("⚠️  DATABASE_URL is not set, every driver is treated as idle")
+            return None
+        return cls(database_url, float(os.environ.get("ACTIVE_DRIVERS_REFRESH_INTERVAL", 5)))
+
+    def priority(self, driver_id: str) -> str:
+        return PRIORITY_ACTIVE if str(driver_id).lower() in self.drivers else PRIORITY_IDLE
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(5)
+
+    def _run(self):
+        asyncio.run(self._loop())
+
+    async def _loop(self):
+        # Imported here so modules using admission control load without asyncpg
+        import asyncpg
+
+        conn = None
+        try:
+            while True:
+                try:
+                    if conn is None or conn.is_closed():
+                        conn = await asyncpg.connect(self.database_url)
+                    rows = await conn.fetch(ACTIVE_DRIVERS_SQL)
+                    self.drivers = frozenset(row['driver_id'] for row in rows)
+                    self.refreshed_at = time.time()
+                except Exception as e:
+                    # Timeouts and closed connections too: the thread must outlive
+                    # any failure, or the set would stay frozen
+                    self.errors += 1
+                    logger.warning(f"🔥 Could not refresh active drivers: {e!r}")
+                    if conn is not None:
+                        conn.terminate()
+                        conn = None
+                if self._stop.wait(self.interval):
+                    break
+        finally:
+            if conn is not None:
+                await conn.close()
+
+
+class AdmissionController:
+    """
+    Decides which fixes a saturated stage still processes.
+
+    Args:
+        max_queue_depth (int): Queue depth at which the stage is saturated.
+        latency_target (float): EWMA fix age, in seconds, at which the stage is saturated.
+        active_rate (float): Token bucket rate for active fixes, 0 for unlimited.
+        idle_rate (float): Token bucket rate for idle fixes while saturated, 0 for unlimited.
+        idle_sample_interval (float): Seconds between admitted fixes of one idle driver while saturated.
+        recover_ratio (float): Saturation ends once both signals are below this share of their target.
+        ewma_alpha (float): Weight of each new latency sample.
+        clock (callable): Monotonic clock, replaceable for simulations.
+    """
+
+    def __init__(self, max_queue_depth: int = 10000, latency_target: float = 2.0,
+                 active_rate: float = 0.0, idle_rate: float = 500.0,
+                 idle_sample_interval: float = 30.0, recover_ratio: float = 0.5,
+                 ewma_alpha: float = 0.05,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_queue_depth = max_queue_depth
+        self.latency_target = latency_target
+        self.idle_sample_interval = idle_sample_interval
+        self.recover_ratio = recover_ratio
+        self.ewma_alpha = ewma_alpha
+        self.buckets = {
+            PRIORITY_ACTIVE: TokenBucket(active_rate, clock=clock),
+            PRIORITY_IDLE: TokenBucket(idle_rate, clock=clock),
+        }
+        self.saturated = False
+        self.queue_depth = 0
+        self.latency = 0.0
+        self.admitted = dict.fromkeys(PRIORITIES, 0)
+        self.shed = dict.fromkeys(PRIORITIES, 0)
+        self.saturations = 0
+        self._clock = clock
+        # When each idle driver last had a fix admitted while saturated. Entries
+        # older than idle_sample_interval no longer matter and are pruned once
+        # the dict has doubled since the last prune, so it stays near the number
+        # of idle drivers seen in one interval.
+        self._last_sampled: Dict[str, float] = {}
+        self._prune_at = 1024
+
+    @classmethod
+    def from_env(cls) -> Optional["AdmissionController"]:
+        """Controller configured from ADMISSION_*, or None when ADMISSION_ENABLED is off."""
+        if os.environ.get("ADMISSION_ENABLED", "false").lower() not in ("1", "true", "yes"):
+            return None
+        return cls(
+            max_queue_depth=int(os.environ.get("ADMISSION_MAX_QUEUE_DEPTH", 10000)),
+            latency_target=float(os.environ.get("ADMISSION_LATENCY_TARGET", 2.0)),
+            active_rate=float(os.environ.get("ADMISSION_ACTIVE_RATE", 0)),
+            idle_rate=float(os.environ.get("ADMISSION_IDLE_RATE", 500)),
+            idle_sample_interval=float(os.environ.get("ADMISSION_IDLE_SAMPLE_INTERVAL", 30)),
+        )
+
+    def observe_queue_depth(self, depth: int):
+        self.queue_depth = depth
+        self._update_saturation()
+
+    def observe_latency(self, seconds: float):
+        # Clamped, so a phone with a wrong clock cannot pin the stage as saturated
+        seconds = min(max(seconds, 0.0), self.latency_target * 10)
+        self.latency += self.ewma_alpha * (seconds - self.latency)
+        self._update_saturation()
+
+    def _update_saturation(self):
+        if self.saturated:
+            ratio = self.recover_ratio
+            if (self.queue_depth < self.max_queue_depth * ratio
+                    and self.latency < self.latency_target * ratio):
+                self.saturated = False
+        elif self.queue_depth >= self.max_queue_depth or self.latency >= self.latency_target:
+            self.saturated = True
+            self.saturations += 1
+
+    def admit(self, priority: str, driver_id: str) -> bool:
+        """
+        Whether to process a fix of ``driver_id`` in class ``priority``.
+
+        Every refusal is counted in ``shed``.
+        """
+        if priority == PRIORITY_ACTIVE:
+            admitted = self.buckets[PRIORITY_ACTIVE].try_acquire()
+        elif not self.saturated:
+            admitted = True
+        else:
+            now = self._clock()
+            last = self._last_sampled.get(driver_id)
+            admitted = ((last is None or now - last >= self.idle_sample_interval)
+                        and self.buckets[PRIORITY_IDLE].try_acquire())
+            if admitted:
+                self._last_sampled[driver_id] = now
+                if len(self._last_sampled) >= self._prune_at:
+                    self._prune_sampled(now)
+
+        if admitted:
+            self.admitted[priority] += 1
+        else:
+            self.shed[priority] += 1
+        return admitted
+
+    def _prune_sampled(self, now: float):
+        cutoff = now - self.idle_sample_interval
+        self._last_sampled = {driver_id: at for driver_id, at in self._last_sampled.items()
+                              if at > cutoff}
+        self._prune_at = max(1024, 2 * len(self._last_sampled))
+
+    def stats(self) -> Dict:
+        return {
+            "saturated": self.saturated,
+            "saturations": self.saturations,
+            "queue_depth": self.queue_depth,
+            "latency_ewma_s": round(self.latency, 3),
+            "admitted": dict(self.admitted),
+            "shed": dict(self.shed),
+            "sampled_drivers": len(self._last_sampled),
+        }
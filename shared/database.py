@@ -0,0 +1,240 @@
+"""
+Database access layer shared by api and driver_api.
+
+Provides a tuned asyncpg pool whose connections prepare the service's hot
+statements once, at connection init, plus the FastAPI dependency and health
+routes built on top of it. Hot statements are run by SQL text and served from
+asyncpg's per-connection statement cache: PreparedStatement objects are
+invalidated every time their connection goes back to the pool, so they
+cannot be kept from one acquire to the next. Pool wait time and saturation are tracked on every
+acquire so they can be exposed without querying Postgres.
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Dict, Optional, Tuple
+
+import asyncpg
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import JSONResponse
+from pydantic_settings import BaseSettings
+
+
+class DatabaseSettings(BaseSettings):
+    database_url: str = os.getenv("DATABASE_URL")
+    db_pool_min_size: int = 10
+    db_pool_max_size: int = 20
+    # Statements kept prepared per connection by asyncpg's LRU cache, the hot
+    # statements included, so it must not be 0.
+    db_statement_cache_size: int = 256
+    db_max_queries: int = 50000
+    db_max_inactive_connection_lifetime: float = 300.0
+    db_command_timeout: float = 5.0
+    db_acquire_timeout: float = 2.0
+
+
+class HotStatement:
+    """A hot statement bound to the connection it runs on for one acquire."""
+
+    __slots__ = ('_conn', 'sql')
+
+    def __init__(self, conn: asyncpg.Connection, sql: str):
+        self._conn = conn
+        self.sql = sql
+
+    async def fetch(self, *args, timeout: Optional[float] = None):
+        return await self._conn.fetch(self.sql, *args, timeout=timeout)
+
+    async def fetchrow(self, *args, timeout: Optional[float] = None):
+        return await self._conn.fetchrow(self.sql, *args, timeout=timeout)
+
+    async def fetchval(self, *args, column: int = 0, timeout: Optional[float] = None):
+        return await self._conn.fetchval(self.sql, *args, column=column, timeout=timeout)
+
+    async def execute(self, *args, timeout: Optional[float] = None):
+        return await self._conn.execute(self.sql, *args, timeout=timeout)
+
+
+class PreparedConnection(asyncpg.Connection):
+    """asyncpg connection whose statement cache holds the hot statements from pool init."""
+
+    __slots__ = ('_hot_statements',)
+
+    async def prepare_hot_statements(self, statements: Dict[str, str]):
+        self._hot_statements = dict(statements)
+        for sql in self._hot_statements.values():
+            # Prepares into the statement cache fetch()/fetchrow() look up by
+            # SQL text; prepare() would return an object outside that cache.
+            await self._get_statement(sql, None)
+
+    def statement(self, name: str) -> HotStatement:
+        return HotStatement(self, self._hot_statements[name])
+
+
+class PoolStats:
+    """Acquire wait times and pool saturation counters."""
+
+    def __init__(self, window: int = 1024):
+        self.acquired = 0
+        self.timeouts = 0
+        self.waiting = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.peak_in_use = 0
+        self._recent = deque(maxlen=window)
+
+    def record_wait(self, seconds: float, in_use: int):
+        self.acquired += 1
+        self.peak_in_use = max(self.peak_in_use, in_use)
+        self.total_wait += seconds
+        self.max_wait = max(self.max_wait, seconds)
+        self._recent.append(seconds)
+
+    def snapshot(self, pool: Optional[asyncpg.Pool]) -> dict:
+        recent = sorted(self._recent)
+        p95 = recent[max(0, int(len(recent) * 0.95) - 1)] if recent else 0.0
+        size = pool.get_size() if pool else 0
+        idle = pool.get_idle_size() if pool else 0
+        max_size = pool.get_max_size() if pool else 0
+        in_use = size - idle
+        return {
+            "size": size,
+            "max_size": max_size,
+            "idle": idle,
+            "in_use": in_use,
+            "waiting": self.waiting,
+            "saturation": round(in_use / max_size, 3) if max_size else 0.0,
+            "peak_saturation": round(self.peak_in_use / max_size, 3) if max_size else 0.0,
+            "acquired": self.acquired,
+            "timeouts": self.timeouts,
+            "wait_mean_ms": round(self.total_wait / self.acquired * 1000, 3) if self.acquired else 0.0,
+            "wait_p95_ms": round(p95 * 1000, 3),
+            "wait_max_ms": round(self.max_wait * 1000, 3),
+        }
+
+
+class Database:
+    """
+    Tuned connection pool with per-connection prepared statements.
+
+    Args:
+        statements (dict): Hot statements to prepare on every connection, by name.
+        settings (DatabaseSettings, optional): Pool settings. Defaults to env values.
+        probe (tuple, optional): ``(name, args)`` of a hot statement run once the pool
+            is warm, on a connection that has been back to the pool, before reporting
+            readiness. It must not change any data.
+    """
+
+    def __init__(self, statements: Dict[str, str], settings: Optional[DatabaseSettings] = None,
+                 probe: Optional[Tuple[str, tuple]] = None):
+        self.statements = dict(statements)
+        self.settings = settings or DatabaseSettings()
+        self.probe = probe
+        self.pool: Optional[asyncpg.Pool] = None
+        self.ready = False
+        self.stats = PoolStats()
+
+    async def connect(self):
+        """Create the pool, prepare the hot statements, warm every connection and run the probe."""
+        self.pool = await asyncpg.create_pool(
+            self.settings.database_url,
+            min_size=self.settings.db_pool_min_size,
+            max_size=self.settings.db_pool_max_size,
+            max_queries=self.settings.db_max_queries,
+            max_inactive_connection_lifetime=self.settings.db_max_inactive_connection_lifetime,
+            command_timeout=self.settings.db_command_timeout,
+            statement_cache_size=self.settings.db_statement_cache_size,
+            connection_class=PreparedConnection,
+            init=self._init_connection,
+        )
+        await self._warm_up()
+        await self._run_probe()
+        self.ready = True
+
+    async def close(self):
+        self.ready = False
+        if self.pool:
+            await self.pool.close()
+            self.pool = None
+
+    async def _init_connection(self, conn: PreparedConnection):
+        await conn.prepare_hot_statements(self.statements)
+
+    async def _warm_up(self):
+        # create_pool already opened min_size connections; hold all of them at
+        # once so each one completes a round trip before we report readiness.
+        conns = [await self.pool.acquire() for _ in range(self.settings.db_pool_min_size)]
+        try:
+            await asyncio.gather(*(conn.execute("SELECT 1") for conn in conns))
+        finally:
+            for conn in conns:
+                await self.pool.release(conn)
+
+    async def _run_probe(self):
+        # Catches hot statements that stop working once their connection has
+        # been released, which _warm_up() has just done to every connection.
+        if self.probe is None:
+            return
+        name, args = self.probe
+        async with self.pool.acquire() as conn:
+            await conn.statement(name).fetchrow(*args)
+
+    async def _acquire(self):
+        self.stats.waiting += 1
+        started = time.perf_counter()
+        try:
+            conn = await self.pool.acquire(timeout=self.settings.db_acquire_timeout)
+        except asyncio.TimeoutError:
+            self.stats.timeouts += 1
+            raise
+        finally:
+            self.stats.waiting -= 1
+        self.stats.record_wait(
+            time.perf_counter() - started,
+            self.pool.get_size() - self.pool.get_idle_size()
+        )
+        return conn
+
+    @asynccontextmanager
+    async def acquire(self):
+        """Acquire a pooled connection, recording the time spent waiting for it."""
+        conn = await self._acquire()
+        try:
+            yield conn
+        finally:
+            await self.pool.release(conn)
+
+    async def connection(self):
+        """FastAPI dependency yielding a pooled connection."""
+        if not self.ready:
+            raise HTTPException(status_code=503, detail="Database connection is not available.")
+        try:
+            conn = await self._acquire()
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=503, detail="Database connection pool exhausted.")
+        try:
+            yield conn
+        finally:
+            await self.pool.release(conn)
+
+    def pool_stats(self) -> dict:
+        return {"ready": self.ready, **self.stats.snapshot(self.pool)}
+
+
+def health_router(database: Database) -> APIRouter:
+    """Readiness and pool statistics routes for a service backed by ``database``."""
+    router = APIRouter(prefix="/health", tags=["Health"])
+
+    @router.get("/ready", summary="Readiness probe, OK once the pool is warm")
+    async def ready():
+        stats = database.pool_stats()
+        return JSONResponse(status_code=200 if database.ready else 503, content=stats)
+
+    @router.get("/pool", summary="Connection pool wait time and saturation")
+    async def pool():
+        return database.pool_stats()
+
+    return router
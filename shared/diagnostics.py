@@ -0,0 +1,446 @@
+"""
+On-demand diagnostics endpoints for the services.
+
+A small HTTP server, on a thread of its own, that answers questions about the
+running process without restarting it under a profiler:
+
+    GET  /profile?seconds=10&interval=0.005&format=collapsed
+              samples every thread's stack with sys._current_frames for the
+              given time and returns collapsed stacks ("a;b;c 42" lines, the
+              input of flamegraph.pl and speedscope), or with format=json the
+              same samples as a d3-flame-graph tree
+    GET  /stacks
+              current stack of every thread and of every task of the asyncio
+              loops registered with ``watch_loop``
+    POST /alloc/start?frames=1    start tracemalloc
+    GET  /alloc?top=20&key=lineno top allocation sites, and growth since the
+                                  previous call
+    POST /alloc/stop              stop tracemalloc and free its traces
+
+Nothing runs unless DIAGNOSTICS_PORT is set: no thread, no socket, no hook,
+so a disabled service pays nothing. tracemalloc slows allocations down and
+only traces between start and stop. Settings:
+
+    DIAGNOSTICS_PORT                  port to listen on, empty or 0 disables (empty)
+    DIAGNOSTICS_HOST                  address to bind (127.0.0.1)
+    DIAGNOSTICS_TOKEN                 required in X-Diagnostics-Token when set, and
+                                      to bind anything but a loopback address
+    DIAGNOSTICS_MAX_PROFILE_SECONDS   longest profile allowed (120)
+
+The server refuses to start on one of the service's public ports, or on a
+non-loopback address without a token, so it cannot be exposed by accident.
+The images have no curl; from inside a container use the client below:
+
+    python -m shared.diagnostics stacks
+    python -m shared.diagnostics profile --seconds 30 > bridge.folded
+    python -m shared.diagnostics alloc start|top|stop
+"""
+
+import argparse
+import asyncio
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import traceback
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+logger = logging.getLogger("diagnostics")
+
+DEFAULT_HOST = "127.0.0.1"
+TOKEN_HEADER = "X-Diagnostics-Token"
+# Allocations made by tracemalloc itself and by imports are noise in a top-N
+ALLOC_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+)
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_stacks(seconds: float, interval: float = 0.005,
+                  exclude: Iterable[int] = ()) -> Counter:
+    """
+    Sample the stacks of all threads but ``exclude`` and the calling one.
+
+    Args:
+        seconds (float): How long to sample for.
+        interval (float): Seconds between two samples.
+        exclude (Iterable[int]): Thread idents not to sample.
+
+    Returns:
+        Counter: Samples per collapsed stack, root first and rooted at the thread name.
+    """
+    skip = set(exclude) | {threading.get_ident()}
+    samples: Counter = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident in skip:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            stack.append(names.get(ident, f"thread-{ident}"))
+            samples[";".join(reversed(stack))] += 1
+        time.sleep(interval)
+    return samples
+
+
+def collapsed(samples: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in samples.most_common())
+
+
+def flame_tree(samples: Counter) -> Dict:
+    """Collapsed stacks as the nested {name, value, children} tree d3-flame-graph draws."""
+    root = {"name": "all", "value": 0, "children": {}}
+    for stack, count in samples.items():
+        root["value"] += count
+        node = root
+        for name in stack.split(";"):
+            child = node["children"].get(name)
+            if child is None:
+                child = node["children"][name] = {"name": name, "value": 0, "children": {}}
+            child["value"] += count
+            node = child
+
+    def finish(node):
+        node["children"] = [finish(child) for child in node["children"].values()]
+        return node
+
+    return finish(root)
+
+
+def thread_stacks() -> str:
+    names = {thread.ident: thread for thread in threading.enumerate()}
+    out = []
+    for ident, frame in sys._current_frames().items():
+        thread = names.get(ident)
+        name = thread.name if thread else f"thread-{ident}"
+        daemon = " daemon" if thread is not None and thread.daemon else ""
+        out.append(f'Thread "{name}" ({ident}{daemon}):\n')
+        out.extend(traceback.format_stack(frame))
+        out.append("\n")
+    return "".join(out)
+
+
+def task_stacks(loop: asyncio.AbstractEventLoop, limit: int = 30) -> str:
+    """Stack of every task of a loop running in another thread."""
+    for _ in range(3):
+        # all_tasks() iterates a WeakSet the loop thread may be changing
+        try:
+            tasks = asyncio.all_tasks(loop)
+            break
+        except RuntimeError:
+            continue
+    else:
+        return "  tasks changed too fast to be listed, try again\n"
+    out = []
+    for task in sorted(tasks, key=lambda t: t.get_name()):
+        coro = task.get_coro()
+        out.append(f'Task "{task.get_name()}" {getattr(coro, "__qualname__", coro)}:\n')
+        frames = task.get_stack(limit=limit)
+        out.extend(traceback.format_list(
+            traceback.StackSummary.extract((f, f.f_lineno) for f in frames)))
+        out.append("\n")
+    return "".join(out)
+
+
+def is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class DiagnosticsServer:
+    """
+    Diagnostics HTTP server of one service.
+
+    Args:
+        service (str): Name reported by the endpoints.
+        port (int): Port to listen on.
+        host (str): Address to bind.
+        token (str, optional): Secret expected in the X-Diagnostics-Token header.
+        public_ports (Iterable[int]): Ports the service serves its users on.
+        max_profile_seconds (float): Longest profile allowed.
+
+    Raises:
+        ValueError: If ``port`` is a public port, or ``host`` is not a loopback
+            address and there is no token.
+    """
+
+    def __init__(self, service: str, port: int, host: str = DEFAULT_HOST,
+                 token: Optional[str] = None, public_ports: Iterable[int] = (),
+                 max_profile_seconds: float = 120.0):
+        if port in set(public_ports):
+            raise ValueError(f"port {port} is a public port of {service}")
+        if not is_loopback(host) and not token:
+            raise ValueError(f"binding {host} needs DIAGNOSTICS_TOKEN")
+        self.service = service
+        self.host = host
+        self.port = port
+        self.token = token
+        self.max_profile_seconds = max_profile_seconds
+        self.loops: Dict[str, asyncio.AbstractEventLoop] = {}
+        self._profiling = threading.Lock()
+        self._alloc_baseline = None
+        self._httpd: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @classmethod
+    def from_env(cls, service: str, public_ports: Iterable[int] = ()) -> Optional["DiagnosticsServer"]:
+        """Server configured from the DIAGNOSTICS_* variables, None when disabled or refused."""
+        port = int(os.getenv("DIAGNOSTICS_PORT") or 0)
+        if not port:
+            return None
+        try:
+            return cls(
+                service, port,
+                host=os.getenv("DIAGNOSTICS_HOST", DEFAULT_HOST),
+                token=os.getenv("DIAGNOSTICS_TOKEN") or None,
+                public_ports=public_ports,
+                max_profile_seconds=float(os.getenv("DIAGNOSTICS_MAX_PROFILE_SECONDS", 120)),
+            )
+        except ValueError as e:
+            logger.error(f"🚫 Diagnostics not started: {e}")
+            return None
+
+    def watch_loop(self, loop: asyncio.AbstractEventLoop, name: str = "main"):
+        """Include the tasks of ``loop`` in /stacks."""
+        self.loops[name] = loop
+
+    def start(self):
+        server = self
+
+        class Handler(_Handler):
+            diagnostics = server
+
+        self._httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="diagnostics", daemon=True)
+        self._thread.start()
+        logger.info(f"🩺 Diagnostics for {self.service} listening on {self.host}:{self.port}")
+
+    def stop(self):
+        if self._httpd is None:
+            return
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._httpd = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def profile(self, seconds: float, interval: float) -> Counter:
+        """
+        Raises:
+            RuntimeError: If a profile is already running.
+        """
+        if not self._profiling.acquire(blocking=False):
+            raise RuntimeError("a profile is already running")
+        try:
+            return sample_stacks(min(seconds, self.max_profile_seconds), interval,
+                                 exclude=(self._thread.ident,))
+        finally:
+            self._profiling.release()
+
+    def stacks(self) -> str:
+        out = [f"# {self.service}, pid {os.getpid()}\n\n", thread_stacks()]
+        for name, loop in self.loops.items():
+            out.append(f"# asyncio loop {name}\n\n")
+            out.append(task_stacks(loop))
+        return "".join(out)
+
+    def alloc_start(self, frames: int = 1) -> Dict:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            self._alloc_baseline = None
+        return {"tracing": True, "frames": tracemalloc.get_traceback_limit()}
+
+    def alloc_stop(self) -> Dict:
+        tracemalloc.stop()
+        self._alloc_baseline = None
+        return {"tracing": False}
+
+    def alloc_top(self, top: int = 20, key: str = "lineno") -> Dict:
+        """
+        Raises:
+            RuntimeError: If tracemalloc is not tracing.
+        """
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not tracing, POST /alloc/start first")
+        snapshot = tracemalloc.take_snapshot().filter_traces(ALLOC_FILTERS)
+        current, peak = tracemalloc.get_traced_memory()
+
+        def site(stat):
+            return [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback]
+
+        report = {
+            "traced_kib": round(current / 1024, 1),
+            "peak_kib": round(peak / 1024, 1),
+            "top": [{"site": site(stat), "kib": round(stat.size / 1024, 1), "count": stat.count}
+                    for stat in snapshot.statistics(key)[:top]],
+        }
+        if self._alloc_baseline is not None:
+            report["growth"] = [
+                {"site": site(stat), "kib": round(stat.size_diff / 1024, 1), "count": stat.count_diff}
+                for stat in snapshot.compare_to(self._alloc_baseline, key)[:top]
+            ]
+        # Calling again after a while shows what keeps growing
+        self._alloc_baseline = snapshot
+        return report
+
+
+class _Handler(BaseHTTPRequestHandler):
+    diagnostics: DiagnosticsServer
+
+    def log_message(self, format, *args):
+        logger.info(f"🩺 {self.address_string()} {format % args}")
+
+    def _reply(self, status: int, body, content_type: str = "application/json"):
+        if not isinstance(body, str):
+            body = json.dumps(body, indent=1)
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _route(self, method: str):
+        token = self.diagnostics.token
+        if token and not hmac.compare_digest(self.headers.get(TOKEN_HEADER, ""), token):
+            return self._reply(403, {"detail": "bad or missing token"})
+        url = urlparse(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            route = ROUTES.get((method, url.path.rstrip("/") or "/"))
+            if route is None:
+                return self._reply(404, {"detail": "no such endpoint", "endpoints": list(ENDPOINTS)})
+            return route(self, params)
+        except ValueError as e:
+            return self._reply(400, {"detail": str(e)})
+        except RuntimeError as e:
+            return self._reply(409, {"detail": str(e)})
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def index(self, params):
+        return self._reply(200, {"service": self.diagnostics.service, "pid": os.getpid(),
+                                 "endpoints": list(ENDPOINTS)})
+
+    def profile(self, params):
+        seconds = float(params.get("seconds", 10))
+        interval = float(params.get("interval", 0.005))
+        if seconds <= 0 or interval <= 0:
+            raise ValueError("seconds and interval must be positive")
+        samples = self.diagnostics.profile(seconds, interval)
+        if params.get("format", "collapsed") == "json":
+            # Trees of long profiles get big, so no indentation
+            return self._reply(200, json.dumps(flame_tree(samples), separators=(",", ":")))
+        return self._reply(200, collapsed(samples), "text/plain")
+
+    def stacks(self, params):
+        return self._reply(200, self.diagnostics.stacks(), "text/plain")
+
+    def alloc(self, params):
+        key = params.get("key", "lineno")
+        if key not in ("lineno", "filename", "traceback"):
+            raise ValueError("key must be lineno, filename or traceback")
+        return self._reply(200, self.diagnostics.alloc_top(int(params.get("top", 20)), key))
+
+    def alloc_start(self, params):
+        return self._reply(200, self.diagnostics.alloc_start(int(params.get("frames", 1))))
+
+    def alloc_stop(self, params):
+        return self._reply(200, self.diagnostics.alloc_stop())
+
+
+ENDPOINTS = {
+    "GET /": _Handler.index,
+    "GET /profile": _Handler.profile,
+    "GET /stacks": _Handler.stacks,
+    "GET /alloc": _Handler.alloc,
+    "POST /alloc/start": _Handler.alloc_start,
+    "POST /alloc/stop": _Handler.alloc_stop,
+}
+ROUTES = {tuple(endpoint.split(" ")): route for endpoint, route in ENDPOINTS.items()}
+
+
+def start_diagnostics(service: str, public_ports: Iterable[int] = ()) -> Optional[DiagnosticsServer]:
+    """Start the diagnostics server if DIAGNOSTICS_PORT is set. Returns it, or None."""
+    server = DiagnosticsServer.from_env(service, public_ports)
+    if server is None:
+        return None
+    try:
+        server.start()
+    except OSError as e:
+        logger.error(f"🚫 Diagnostics could not listen on {server.host}:{server.port}: {e}")
+        return None
+    return server
+
+
+def main(argv: Optional[List[str]] = None):
+    """Client for the endpoints, for containers without curl."""
+    from urllib.error import HTTPError
+    from urllib.request import Request, urlopen
+
+    parser = argparse.ArgumentParser(description="Query a service's diagnostics endpoints.")
+    parser.add_argument("--host", default=os.getenv("DIAGNOSTICS_HOST", DEFAULT_HOST))
+    parser.add_argument("--port", type=int, default=int(os.getenv("DIAGNOSTICS_PORT") or 0))
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("stacks")
+    profile = commands.add_parser("profile")
+    profile.add_argument("--seconds", type=float, default=10)
+    profile.add_argument("--interval", type=float, default=0.005)
+    profile.add_argument("--format", choices=("collapsed", "json"), default="collapsed")
+    alloc = commands.add_parser("alloc")
+    alloc.add_argument("action", choices=("start", "top", "stop"))
+    alloc.add_argument("--top", type=int, default=20)
+    alloc.add_argument("--frames", type=int, default=1)
+    args = parser.parse_args(argv)
+    if not args.port:
+        parser.error("DIAGNOSTICS_PORT is not set, pass --port")
+
+    method, path = "GET", f"/{args.command}"
+    if args.command == "profile":
+        path += f"?seconds={args.seconds}&interval={args.interval}&format={args.format}"
+    elif args.command == "alloc" and args.action == "top":
+        path = f"/alloc?top={args.top}"
+    elif args.command == "alloc":
+        method, path = "POST", f"/alloc/{args.action}?frames={args.frames}"
+    request = Request(f"http://{args.host}:{args.port}{path}", method=method)
+    if os.getenv("DIAGNOSTICS_TOKEN"):
+        request.add_header(TOKEN_HEADER, os.environ["DIAGNOSTICS_TOKEN"])
+    try:
+        with urlopen(request) as response:
+            body = response.read().decode("utf-8")
+            sys.stdout.write(body if body.endswith("\n") else body + "\n")
+    except HTTPError as e:
+        sys.stderr.write(e.read().decode("utf-8") + "\n")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,39 @@
+"""
+Hot SQL statements served by the APIs.
+
+They are prepared once per pooled connection (see shared.database) and are
+also driven by benchmarks/sql_hot_path.py, so keep the text here as the
+single source of truth.
+"""
+
+TRACK_DELIVERY_SQL = """
+    SELECT dd.order_id,
+           dd.delivery_status,
+           ROUND((ST_Distance(ds.geoposition::geography, o.delivery_address::geography) / 100.0) * 60.0) AS remaining_time_seconds,
+           d.full_name                    AS driver_name,
+           r.name                         AS restaurant_name,
+
+           ST_Y(ds.geoposition::geometry) AS driver_latitude,
+           ST_X(ds.geoposition::geometry) AS driver_longitude
+    FROM driver_delivers dd
+             JOIN orders o ON dd.order_id = o.id
+             JOIN restaurants r ON o.restaurant_id = r.id
+        -- LEFT JOINs are used for driver info, as an order might be assigned but not yet in progress
+             LEFT JOIN drivers d ON dd.driver_id = d.id
+             LEFT JOIN driver_status ds ON dd.driver_id = ds.driver_id AND ds.is_active = TRUE
+    WHERE dd.order_id = $1;
+"""
+
+UPDATE_DRIVER_LOCATION_SQL = """
+    UPDATE driver_status
+    SET
+        geoposition = ST_SetSRID(ST_MakePoint($1, $2), 4326),
+        last_updated_at = NOW()
+    WHERE driver_id = $3 and is_active = TRUE
+    RETURNING
+        driver_id,
+        is_active,
+        last_updated_at,
+        ST_Y(geoposition::geometry) as latitude,
+        ST_X(geoposition::geometry) as longitude;
+"""
@@ -0,0 +1,215 @@
+"""
+Region-aware routing of driver position fixes.
+
+Fixes are published on hierarchical MQTT topics (``drivers/<region>/<driver_id>/pos``)
+and each region maps to its own Kafka topic (``<base>.<region>``) or, in
+partition mode, to a fixed partition of the base topic. Fixes that arrive on a
+topic without a region (such as the legacy ``sensor/data``) are placed with the
+geohash prefixes of the region table.
+
+The table is read from the REGION_TABLE environment variable (JSON) or from
+the file named by REGION_TABLE_FILE, for example::
+
+    {
+        "madrid": {"geohash": ["ezjm", "ezjq"]},
+        "barcelona": {"geohash": ["sp3e"], "topic": "driver-pos.bcn"}
+    }
+
+An empty table routes everything to the base topic, as before regions existed.
+Fixes outside every region go to the base topic too; in partition mode they
+get a partition of their own (one past the last region partition unless
+KAFKA_UNASSIGNED_PARTITION says otherwise), so they never land on a region's
+partition. Consumers ask for them as the ``unassigned`` region.
+"""
+
+import json
+import os
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+FIX_TOPIC_PREFIX = "drivers"
+FIX_TOPIC_SUFFIX = "pos"
+FIX_TOPIC_FILTER = f"{FIX_TOPIC_PREFIX}/+/+/{FIX_TOPIC_SUFFIX}"
+
+REGION_MODE_TOPIC = "topic"
+REGION_MODE_PARTITION = "partition"
+
+# Name consumers use for the fixes outside every region
+UNASSIGNED = "unassigned"
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash(lat: float, lon: float, precision: int = 6) -> str:
+    """Encode a position as a geohash of ``precision`` characters."""
+    lat_lo, lat_hi = -90.0, 90.0
+    lon_lo, lon_hi = -180.0, 180.0
+    chars = []
+    bits, value, even = 0, 0, True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if lon >= mid:
+                value = value << 1 | 1
+                lon_lo = mid
+            else:
+                value <<= 1
+                lon_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                value = value << 1 | 1
+                lat_lo = mid
+            else:
+                value <<= 1
+                lat_hi = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def fix_topic(region: str, driver_id: str) -> str:
+    """MQTT topic a driver publishes its fixes on."""
+    return f"{FIX_TOPIC_PREFIX}/{region}/{driver_id}/{FIX_TOPIC_SUFFIX}"
+
+
+def parse_fix_topic(topic: str) -> Optional[Tuple[str, str]]:
+    """
+    Split a ``drivers/<region>/<driver_id>/pos`` topic.
+
+    Returns:
+        tuple: (region, driver_id), or None for topics outside the scheme.
+    """
+    parts = topic.split("/")
+    if len(parts) != 4 or parts[0] != FIX_TOPIC_PREFIX or parts[3] != FIX_TOPIC_SUFFIX:
+        return None
+    return parts[1], parts[2]
+
+
+class Region(NamedTuple):
+    name: str
+    topic: str
+    partition: int
+    geohash_prefixes: Tuple[str, ...]
+
+
+class RegionRouter:
+    """
+    Maps fixes to the Kafka topic and partition of their region.
+
+    Args:
+        table (dict): Region table, region name to its settings.
+        base_topic (str): Kafka topic for fixes outside every region.
+        mode (str): "topic" for a topic per region, "partition" for a
+            partition per region on the base topic.
+        unassigned_partition (int, optional): Partition of the base topic for fixes
+            outside every region in partition mode. Defaults to the one after the
+            last region partition.
+
+    Raises:
+        ValueError: On an unknown mode, or regions sharing a partition with each
+            other or with the unassigned fixes.
+    """
+
+    def __init__(self, table: Dict[str, dict], base_topic: str, mode: str = REGION_MODE_TOPIC,
+                 unassigned_partition: Optional[int] = None):
+        if mode not in (REGION_MODE_TOPIC, REGION_MODE_PARTITION):
+            raise ValueError(f"Unknown region mode: {mode}")
+        if UNASSIGNED in table:
+            raise ValueError(f"'{UNASSIGNED}' is reserved and cannot name a region")
+        self.base_topic = base_topic
+        self.mode = mode
+        self.regions: Dict[str, Region] = {}
+        self._by_prefix: Dict[str, Region] = {}
+        self._by_topic: Dict[str, Region] = {}
+        self._by_partition: Dict[int, Region] = {}
+
+        for index, (name, settings) in enumerate(table.items()):
+            region = Region(
+                name=name,
+                topic=settings.get("topic", f"{base_topic}.{name}"),
+                partition=int(settings.get("partition", index)),
+                geohash_prefixes=tuple(settings.get("geohash", ())),
+            )
+            if mode == REGION_MODE_PARTITION and region.partition in self._by_partition:
+                raise ValueError(f"Regions {self._by_partition[region.partition].name} and {name} "
+                                 f"share partition {region.partition}")
+            self.regions[name] = region
+            self._by_topic[region.topic] = region
+            self._by_partition[region.partition] = region
+            for prefix in region.geohash_prefixes:
+                self._by_prefix[prefix] = region
+
+        if unassigned_partition is None:
+            unassigned_partition = max(self._by_partition, default=-1) + 1
+        if mode == REGION_MODE_PARTITION and unassigned_partition in self._by_partition:
+            raise ValueError(f"Partition {unassigned_partition} is both region "
+                             f"{self._by_partition[unassigned_partition].name} and unassigned fixes")
+        self.unassigned_partition = unassigned_partition
+
+        # Longest prefixes are probed first so nested regions win
+        self._prefix_lengths = sorted({len(p) for p in self._by_prefix}, reverse=True)
+
+    @classmethod
+    def from_env(cls, base_topic: str) -> "RegionRouter":
+        """Build the router from REGION_TABLE / REGION_TABLE_FILE, KAFKA_REGION_MODE and
+        KAFKA_UNASSIGNED_PARTITION."""
+        raw = os.environ.get("REGION_TABLE")
+        path = os.environ.get("REGION_TABLE_FILE")
+        if not raw and path:
+            with open(path) as f:
+                raw = f.read()
+        table = json.loads(raw) if raw else {}
+        unassigned = os.environ.get("KAFKA_UNASSIGNED_PARTITION")
+        return cls(table, base_topic, os.environ.get("KAFKA_REGION_MODE", REGION_MODE_TOPIC),
+                   int(unassigned) if unassigned else None)
+
+    def region_for_position(self, lat: float, lon: float) -> Optional[Region]:
+        if not self._prefix_lengths:
+            return None
+        code = geohash(lat, lon, self._prefix_lengths[0])
+        for length in self._prefix_lengths:
+            region = self._by_prefix.get(code[:length])
+            if region:
+                return region
+        return None
+
+    def resolve(self, mqtt_topic: str, lat: Optional[float] = None,
+                lon: Optional[float] = None) -> Optional[Region]:
+        """Region of a fix: from its MQTT topic when it carries one, else from its position."""
+        parsed = parse_fix_topic(mqtt_topic)
+        if parsed:
+            return self.regions.get(parsed[0])
+        if lat is None or lon is None:
+            return None
+        return self.region_for_position(lat, lon)
+
+    def destination(self, region: Optional[Region]) -> Tuple[str, Optional[int]]:
+        """Kafka (topic, partition) for a region, partition is None when Kafka should pick it."""
+        if self.mode == REGION_MODE_PARTITION and self.regions:
+            # Left to Kafka, unassigned fixes would be hashed onto region partitions
+            return self.base_topic, region.partition if region else self.unassigned_partition
+        if region is None:
+            return self.base_topic, None
+        return region.topic, None
+
+    def region_of(self, topic: str, partition: Optional[int] = None) -> Optional[Region]:
+        """Region of a Kafka record from where it was read, the inverse of destination()."""
+        if self.mode == REGION_MODE_PARTITION:
+            return self._by_partition.get(partition) if topic == self.base_topic else None
+        return self._by_topic.get(topic)
+
+    def _lookup(self, names: Iterable[str]) -> List[Optional[Region]]:
+        """Regions by name, None standing for the unassigned fixes."""
+        unknown = [name for name in names if name not in self.regions and name != UNASSIGNED]
+        if unknown:
+            raise ValueError(f"Unknown regions: {', '.join(unknown)}")
+        return [self.regions.get(name) for name in names]
+
+    def topics_for(self, names: Iterable[str]) -> List[str]:
+        return [self.destination(region)[0] for region in self._lookup(names)]
+
+    def partitions_for(self, names: Iterable[str]) -> List[int]:
+        return [region.partition if region else self.unassigned_partition for region in self._lookup(names)]
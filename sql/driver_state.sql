@@ -0,0 +1,7 @@
+-- Driver state machine column, written in batches by driver_events when
+-- STATE_ENGINE_ENABLED is set (see driver_events/state_engine.py).
+-- Safe to run on an existing database: every statement is idempotent.
+
+-- One of 'offline', 'idle', 'heading_to_restaurant', 'picked_up', 'delivering'
+ALTER TABLE driver_status
+    ADD COLUMN IF NOT EXISTS state VARCHAR(24) NOT NULL DEFAULT 'offline';
@@ -0,0 +1,14 @@
+-- Indexes backing the hot statements measured by benchmarks/sql_hot_path.py.
+-- Safe to run on an existing database: every statement is idempotent.
+
+-- Trigger lookup in update_remaining_time_func():
+--   WHERE dd.driver_id = NEW.driver_id AND dd.delivery_status = 'in_progress'
+-- Without it every driver_status UPDATE scans driver_delivers.
+CREATE INDEX IF NOT EXISTS driver_delivers_driver_id_status_idx
+    ON driver_delivers (driver_id, delivery_status);
+
+-- calculate_initial_delivery_times() only looks at in-progress deliveries that
+-- still have no estimate, which is a tiny fraction of the table once seeded.
+CREATE INDEX IF NOT EXISTS driver_delivers_pending_eta_idx
+    ON driver_delivers (driver_id)
+    WHERE delivery_status = 'in_progress' AND remaining_time_seconds IS NULL;